@@ -4,27 +4,70 @@ import os
 from scipy.stats import f_oneway, shapiro
 import pandas as pd
 from statsmodels.stats.multicomp import pairwise_tukeyhsd
+from results_io import columns, is_result_path, read_run
+from results_aggregation import aggregate_files, aggregate_folder
+from results_catalog import ResultsCatalog
+from resampling_stats import print_resampling_tests
 
 
 
-def find_header_index(file_path):
+def is_result_file(file_path):
     """
-    Find the header in the txt file to know how many rows to skip 
+    Check if a file is a simulation result in the text (.txt) or binary (.npz) format, not a checkpoint
     """
-    with open(file_path, 'r') as file:
-        for i, line in enumerate(file):
-            if 'Timestep, Food Found, AntsFood' in line:
-                return i + 1
-    return 0
+    return os.path.isfile(file_path) and is_result_path(file_path)
 
 
-def plot_average_food_found_multiple_folders(main_folder, sub_folders, path_where_to_save_graph, graph_name):
+def load_run(file_path):
+    """
+    Load the time series of one simulation result file as a DataFrame
+    """
+    data = read_run(file_path)
+    return pd.DataFrame({name: data[key] for key, name in columns})
+
+
+def aggregate_groups(main_folder, sub_folders):
+    """
+    Read every result file of the sub folders once and return a dictionary with the
+    running food found statistics (mean, standard deviation and final values) per folder.
+    """
+    aggregates = {}
+    for folder_path in sub_folders:
+        # Get the full path of the subfolder
+        sub_folder_path = os.path.join(main_folder, folder_path)
+        if not os.path.exists(sub_folder_path):
+            print(f"Folder does not exist: {sub_folder_path}")
+            continue  # Skip to the next subfolder
+
+        aggregate = aggregate_folder(sub_folder_path)
+        if aggregate is None:
+            print(f"No valid files found in folder: {folder_path}")
+            continue
+        aggregates[folder_path] = aggregate
+    return aggregates
+
+
+def aggregate_catalog_groups(main_folder, by='pheromone_deposit', label='deposit{}', **filters):
+    """
+    Select runs through the results catalog instead of sub folders. The results under main_folder
+    are indexed first (only new or changed files are read), then the runs that match the filters
+    are grouped by the value of the field by. Returns the group labels and the aggregates per label.
+    """
+    with ResultsCatalog(os.path.join(main_folder, 'catalog.sqlite')) as catalog:
+        catalog.index_folder(main_folder)
+        groups = catalog.groups(by, main_folder, **filters)
+    aggregates = {label.format(value): aggregate_files(paths) for value, paths in groups.items()}
+    return list(aggregates), aggregates
+
+
+def plot_average_food_found_multiple_folders(main_folder, sub_folders, path_where_to_save_graph, graph_name, aggregates=None):
     """
     Load multiple files from multiple folders, calculate the average Food Found and standard deviation
     for each timestep per folder, and plot all results in one graph with improved line visibility.
+    Pass the result of aggregate_groups as aggregates to reuse files that were already read.
     """
-
-    column_names = ["Timestep", "Food Found", "AntsFood"]
+    if aggregates is None:
+        aggregates = aggregate_groups(main_folder, sub_folders)
 
     plt.figure(figsize=(12, 8))  
     line_style = '-'
@@ -33,30 +76,12 @@ def plot_average_food_found_multiple_folders(main_folder, sub_folders, path_wher
     
     
     for folder_idx, folder_path in enumerate(sub_folders):
-        all_data = []
-        
-        # Get all files from current folder
-        sub_folder_path = os.path.join(main_folder, folder_path)
-        
-        for file_name in os.listdir(sub_folder_path):
-            file_path = os.path.join(sub_folder_path, file_name)
-            
-            if os.path.isfile(file_path) and file_name.endswith('.txt'):
-                skiprows = find_header_index(file_path=file_path)
-                data = pd.read_csv(file_path, skiprows=skiprows, names=column_names)
-                all_data.append(data)
-        
-        if not all_data:
-            print(f"No valid files found in folder: {folder_path}")
+        if folder_path not in aggregates:
             continue
         
-        # Combine all data from this folder
-        combined_data = pd.concat(all_data, axis=0)
-        
-        # Calculate average and standard deviation for this folder
-        grouped = combined_data.groupby("Timestep")
-        average_data = grouped.mean().reset_index()
-        std_data = grouped.std().reset_index()
+        # Average and standard deviation for this folder
+        timesteps = aggregates[folder_path].timesteps()
+        average_food_found, std_food_found = aggregates[folder_path].mean_std()
         
         # Folder name for legend
         folder_name = os.path.basename(folder_path)
@@ -67,17 +92,17 @@ def plot_average_food_found_multiple_folders(main_folder, sub_folders, path_wher
         color = colors[folder_idx % len(colors)]
         
         # Plot the mean line 
-        plt.plot(average_data["Timestep"], 
-                average_data["Food Found"], 
+        plt.plot(timesteps, 
+                average_food_found, 
                 label=f"{folder_name}",
                 color=color,
                 linestyle=line_style,
                 linewidth=2)  
         
         # Shaded area for standard deviation 
-        plt.fill_between(average_data["Timestep"],
-                        average_data["Food Found"] - std_data["Food Found"],
-                        average_data["Food Found"] + std_data["Food Found"],
+        plt.fill_between(timesteps,
+                        average_food_found - std_food_found,
+                        average_food_found + std_food_found,
                         color=color,
                         alpha=0.1)  
 
@@ -93,44 +118,30 @@ def plot_average_food_found_multiple_folders(main_folder, sub_folders, path_wher
     plt.close()
 
 
-def food_found_last_timestep_per_group(main_folder, sub_folders):
+def food_found_last_timestep_per_group(main_folder, sub_folders, aggregates=None):
     """
     Load multiple files from multiple folders and return a dictionary of lists
     where each key is a group (subfolder) and the value is a list of food found 
     at the last timestep for each file in that group.
+    Pass the result of aggregate_groups as aggregates to reuse files that were already read.
     """
-    column_names = ["Timestep", "Food Found", "AntsFood"]
-    results = {}
-    
-    for folder_path in sub_folders:
-        all_last_food_found = []
-        
-        # Get the full path of the subfolder
-        sub_folder_path = os.path.join(main_folder, folder_path)
-        if not os.path.exists(sub_folder_path):
-            print(f"Folder does not exist: {sub_folder_path}")
-            continue  # Skip to the next subfolder
-        
-        # Iterate over all .txt files in the folder
-        for file_name in os.listdir(sub_folder_path):
-            file_path = os.path.join(sub_folder_path, file_name)
-            
-            if os.path.isfile(file_path) and file_name.endswith('.txt'):
-                skiprows = find_header_index(file_path=file_path)
-                data = pd.read_csv(file_path, skiprows=skiprows, names=column_names)
-                
-                # Get the food found at the last timestep
-                last_food_found = data["Food Found"].iloc[-1]
-                all_last_food_found.append(last_food_found)
-        
-        if not all_last_food_found:
-            print(f"No valid files found in folder: {folder_path}")
-            continue
-        
-        # Store all values for this group
-        results[folder_path] = all_last_food_found
+    if aggregates is None:
+        aggregates = aggregate_groups(main_folder, sub_folders)
     
-    return results
+    # Store all values per group
+    return {folder_path: aggregate.final_values for folder_path, aggregate in aggregates.items()}
+
+
+def time_to_target_per_group(main_folder, sub_folders, aggregates=None):
+    """
+    Like food_found_last_timestep_per_group, but with the number of timesteps of every run: the
+    time to reach the food target, runs that ran out of time count as taking all their timesteps.
+    """
+    if aggregates is None:
+        aggregates = aggregate_groups(main_folder, sub_folders)
+
+    return {folder_path: aggregate.run_lengths for folder_path, aggregate in aggregates.items()}
+
 
 def shapiro_test(grouped_data):
     """
@@ -149,16 +160,10 @@ def shapiro_test(grouped_data):
 
 def anova_test(grouped_data):
     """
-    Perform one sided anova test
+    Perform one sided anova test over all groups in the data
     """
-    group_0 = grouped_data["deposit0.0"]
-    group_02 = grouped_data["deposit0.2"]
-    group_04 = grouped_data["deposit0.4"]
-    group_06 = grouped_data["deposit0.6"]
-    group_08 = grouped_data["deposit0.8"]
-
     # One-way ANOVA
-    f_stat, p_value = f_oneway(group_0, group_02, group_04, group_06, group_08)
+    f_stat, p_value = f_oneway(*grouped_data.values())
     print(f"F-statistic: {f_stat}")
     print(f"P-value: {p_value}")
 
@@ -200,14 +205,26 @@ def main():
         sub_folders.append(file_path)  
     """
 
-    plot_average_food_found_multiple_folders(main_folder, sub_folders, path_where_to_save_graph, graph_name)
+    # Read every result file once, the plot and the tests share the aggregates
+    aggregates = aggregate_groups(main_folder, sub_folders)
+
+    # Option C: select the runs by their parameters through the results catalog
+    """
+    sub_folders, aggregates = aggregate_catalog_groups(main_folder, by='pheromone_deposit', decay_rate=0.2)
+    """
+
+    plot_average_food_found_multiple_folders(main_folder, sub_folders, path_where_to_save_graph, graph_name, aggregates)
 
-    grouped_data = food_found_last_timestep_per_group(main_folder, sub_folders)
+    grouped_data = food_found_last_timestep_per_group(main_folder, sub_folders, aggregates)
 
     shapiro_test(grouped_data=grouped_data)
     anova_test(grouped_data=grouped_data)
     tukeys_test(grouped_data=grouped_data)
 
+    # Bootstrap intervals, permutation tests and effect sizes, no normality needed
+    print_resampling_tests(grouped_data, 'Food found')
+    print_resampling_tests(time_to_target_per_group(main_folder, sub_folders, aggregates), 'Time to target')
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,83 @@
+import math
+import numpy as np
+from scipy.stats import t as student_t
+from sweep_scheduler import run_sweep
+
+
+def confidence_interval_width(values, confidence=0.95):
+    """
+    Width of the t-based confidence interval of the mean of values, infinite with fewer than two values.
+    """
+    n = len(values)
+    if n < 2:
+        return math.inf
+    return 2*student_t.ppf((1 + confidence)/2, n - 1)*np.std(values, ddof=1)/math.sqrt(n)
+
+
+def replicates_needed(values, target_width, confidence=0.95):
+    """
+    Estimate of the number of values at which the confidence interval reaches target_width,
+    assuming the standard deviation stays as it is.
+    """
+    n = len(values)
+    if n < 2:
+        return n + 2
+    half_width = student_t.ppf((1 + confidence)/2, n - 1)*np.std(values, ddof=1)
+    return math.ceil((2*half_width/target_width)**2)
+
+
+def run_adaptive_sweep(target, cells, make_replicate, statistic, target_width, confidence=0.95, batch_size=4,
+                       min_replicates=4, max_replicates=100, processes=None, on_result=None):
+    """
+    Run replicates of every cell in batches until the confidence interval of the mean of the
+    statistic is at most target_width wide, or the cell used max_replicates replicates.
+    make_replicate(cell, i) returns the specification of replicate i of a cell and
+    statistic(result) the values of the statistic for a result (a list, ensemble runs give
+    several). Every round runs the batches of all unfinished cells in one sweep, cells that
+    are far from their target get larger batches.
+    Returns a dictionary per cell with the values, the number of replicate runs, the mean,
+    the interval width and whether the target was reached.
+    """
+    values = {cell: [] for cell in cells}
+    runs = {cell: 0 for cell in cells}
+    open_cells = list(cells)
+    round_number = 0
+    while open_cells:
+        round_number += 1
+        specs = []
+        owners = []
+        for cell in open_cells:
+            # Runs for the values that are still needed, a run can give several values
+            values_per_run = len(values[cell])/runs[cell] if runs[cell] else 1
+            needed = max(replicates_needed(values[cell], target_width, confidence), min_replicates) - len(values[cell])
+            count = max(batch_size, math.ceil(needed/max(values_per_run, 1)))
+            count = min(count, max_replicates - runs[cell])
+            for i in range(runs[cell], runs[cell] + count):
+                specs.append(make_replicate(cell, i))
+                owners.append(cell)
+            runs[cell] += count
+        print(f"Round {round_number}: {len(specs)} runs for {len(open_cells)} cells")
+        for cell, result in zip(owners, run_sweep(target, specs, processes, on_result=on_result)):
+            values[cell].extend(statistic(result))
+
+        open_cells = [cell for cell in open_cells
+                      if (len(values[cell]) < min_replicates
+                          or confidence_interval_width(values[cell], confidence) > target_width)
+                      and runs[cell] < max_replicates]
+
+    summary = {}
+    for cell in cells:
+        width = confidence_interval_width(values[cell], confidence)
+        summary[cell] = {'values': values[cell], 'replicates': runs[cell], 'mean': float(np.mean(values[cell])),
+                         'ci_width': width, 'converged': width <= target_width}
+    return summary
+
+
+def print_summary(summary):
+    """
+    Print how many replicates every cell used and where it converged.
+    """
+    for cell, cell_summary in summary.items():
+        state = 'converged' if cell_summary['converged'] else 'not converged'
+        print(f"{cell}: {cell_summary['replicates']} replicates, {len(cell_summary['values'])} values, "
+              f"mean {cell_summary['mean']:.2f}, CI width {cell_summary['ci_width']:.2f} ({state})")
@@ -1,7 +1,12 @@
 
+import functools
+import sys
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 from maze_generator_with_nPaths import generate_maze_with_paths, upscale_maze
+from maze_index import MazeIndex, opposite
+from pheromone_store import PheromoneStore
 
 # Number of paths change this to 120, 55, 32, or 16
 nPaths = 32
@@ -51,17 +56,75 @@ decay_rate = 0.15
 # Maximum amount of pheromones per cell
 max_pheromone = 0.99
 
+# Searching ants turn back once their path is wander_cutoff times longer than the shortest path
+# from the colony to the food, None lets them wander as far as the maze allows
+wander_cutoff = None
+
 # Cell types
 colony = -1
 open_space = 0
 food = 1
 wall = 2
 
+# Outcomes of Ant.step: moved to an unvisited cell, stepped back out of a dead end,
+# carried food one cell back to the colony, or stayed on its cell
+step_forward = 0
+step_backtrack = 1
+step_return = 2
+step_stay = 3
+
+# Parameters that can be set per run with set_parameters
+parameter_names = ('nPaths', 'ntimeSteps', 'maze_dimention', 'maze_scale', 'colony_position', 'food_position',
+                   'nAnts', 'nWaveAnts', 'WaveTimesteps', 'ants_with_food_returned', 'pheromone_deposit',
+                   'decay_strength', 'base_chance', 'decay_rate', 'max_pheromone', 'wander_cutoff')
+
+
+def get_parameters():
+    """
+    Return the current simulation parameters as a dictionary.
+    """
+    return {name: globals()[name] for name in parameter_names}
+
+
+def wander_limit(maze_index, colony_position, food_position):
+    """
+    Most moves a searching ant makes before it turns back, from wander_cutoff and the shortest
+    path from the colony to the food, sys.maxsize without a cutoff.
+    """
+    if wander_cutoff is None:
+        return sys.maxsize
+    from distance_fields import DistanceFields
+    fields = DistanceFields.for_cells(maze_index, maze_index.cell_of(colony_position), maze_index.cell_of(food_position))
+    return int(wander_cutoff*fields.optimal_length)
+
+
+def set_parameters(**parameters):
+    """
+    Set simulation parameters. When the maze size changes, the colony and food
+    positions follow it unless they are given as well.
+    """
+    global maze_size, colony_position, food_position
+    unknown = set(parameters) - set(parameter_names)
+    if unknown:
+        raise ValueError(f"Unknown simulation parameters: {sorted(unknown)}")
+    globals().update(parameters)
+    maze_size = maze_dimention*maze_scale
+    if 'colony_position' in parameters:
+        colony_position = tuple(colony_position)
+    elif 'maze_dimention' in parameters or 'maze_scale' in parameters:
+        colony_position = (maze_scale, maze_scale)
+    if 'food_position' in parameters:
+        food_position = tuple(food_position)
+    elif 'maze_dimention' in parameters or 'maze_scale' in parameters:
+        food_position = (maze_size-maze_scale-1, maze_size-maze_scale-1)
+
 
 class Model:
-    def __init__(self, maze, width, height):
+    def __init__(self, maze, width, height, rng=None):
         """
         Initialize the model with width, height, and number of ants.
+        rng is the random stream of the run (an rng_streams.BlockRandom), without it the
+        ants use the global numpy random state.
         """
         self.width = width
         self.height = height
@@ -69,6 +132,11 @@ class Model:
         self.nWaveAnts = nWaveAnts
         self.WaveTimesteps = WaveTimesteps
         self.total_ants_spawned = 0
+        self.rng = rng
+        # Optional recorder.RunRecorder that stores the state after every update
+        self.recorder = None
+        # Optional profiling.PhaseProfiler that times the phases of every update
+        self.profiler = None
 
         # Our grid is a maze with walls (2) and open spaces (0)
         self.grid = maze
@@ -80,8 +148,12 @@ class Model:
         # Colony is represented as a -1 and food as a 1
         self.grid[self.colony_position] = colony
         self.grid[self.food_position] = food
-        # Initialize pheromone grid
-        self.pheromones = np.zeros_like(maze, dtype = float)
+        # Open cells and their neighbors, built once per maze
+        self.maze_index = MazeIndex.for_grid(self.grid)
+        # Most moves of a searching ant, see wander_cutoff
+        self.max_moves = wander_limit(self.maze_index, self.colony_position, self.food_position)
+        # Initialize pheromone store, it only keeps the open cells
+        self.pheromone_store = PheromoneStore(self.maze_index)
         # Initialize ants at the colony
         self.ants = []
 
@@ -91,6 +163,9 @@ class Model:
         # Track if food is discovered
         self.food_discovered = False
 
+        # Number of ants carrying food after the last update
+        self.ants_with_food = 0
+
     def spawn_ants(self):
         """
         Spawn a wave of ants if the maximum number of ants has not been reached.
@@ -98,139 +173,305 @@ class Model:
         if self.total_ants_spawned < self.nAnts:
             new_ants = min(self.nWaveAnts, self.nAnts - self.total_ants_spawned)
             for _ in range(new_ants):
-                self.ants.append(Ant(self.grid, self.pheromones, self.colony_position))
+                self.ants.append(Ant(self.maze_index, self.pheromone_store, self.colony_position, self.rng, self.max_moves))
             self.total_ants_spawned += new_ants
 
+    @property
+    def pheromones(self):
+        """
+        Pheromone levels as a grid of the maze shape.
+        """
+        return self.pheromone_store.dense()
+
+    def count_ants_with_food(self):
+        """
+        Number of ants currently carrying food.
+        """
+        return self.ants_with_food
+
+    def ant_states(self):
+        """
+        Cell ids and food flags of the spawned ants as two arrays.
+        """
+        cells = np.fromiter((ant.cell for ant in self.ants), dtype=np.int64, count=len(self.ants))
+        hasfood = np.fromiter((ant.hasfood for ant in self.ants), dtype=bool, count=len(self.ants))
+        return cells, hasfood
+
+    def ant_positions(self):
+        """
+        Positions (x, y) of the ants without food and of the ants with food, as two (n, 2) arrays.
+        """
+        cells, hasfood = self.ant_states()
+        coords = self.maze_index.coords[cells]
+        return coords[~hasfood], coords[hasfood]
+
+    def ant_path_lengths(self):
+        """
+        Moves on the path of every spawned ant and the length of its last path to the food
+        (cells from the colony to the food, 0 if it never found food) as two arrays.
+        """
+        return (np.array([len(ant.moves) for ant in self.ants], dtype=np.int64),
+                np.array([ant.final_path_length for ant in self.ants], dtype=np.int64))
+
+    def get_state(self):
+        """
+        State of the run as arrays and numbers, in the format shared by the single run engines,
+        see checkpoint.py. The path of ant i is ant_moves[sum(ant_move_counts[:i]):][:ant_move_counts[i]].
+        """
+        cells, hasfood = self.ant_states()
+        move_counts, final_path_lengths = self.ant_path_lengths()
+        state = self.pheromone_store.get_state()
+        state.update(total_ants_spawned=self.total_ants_spawned, food_found=self.food_found,
+                     food_discovered=self.food_discovered, ants_with_food=self.ants_with_food,
+                     ant_cell=cells, ant_hasfood=hasfood, ant_final_path_length=final_path_lengths,
+                     ant_move_counts=move_counts, ant_moves=np.frombuffer(b''.join(ant.moves for ant in self.ants), dtype=np.uint8),
+                     ant_visited=np.array([np.frombuffer(ant.visited, dtype=np.uint8) for ant in self.ants],
+                                          dtype=np.uint8).reshape(len(self.ants), -1))
+        return state
+
+    def set_state(self, state):
+        """
+        Continue from a state returned by get_state.
+        """
+        self.pheromone_store.set_state(state)
+        self.total_ants_spawned = int(state['total_ants_spawned'])
+        self.food_found = int(state['food_found'])
+        self.food_discovered = bool(state['food_discovered'])
+        self.ants_with_food = int(state['ants_with_food'])
+        offsets = np.r_[0, np.cumsum(state['ant_move_counts'])]
+        self.ants = []
+        for i in range(len(state['ant_cell'])):
+            ant = Ant(self.maze_index, self.pheromone_store, self.colony_position, self.rng, self.max_moves)
+            ant.cell = int(state['ant_cell'][i])
+            ant.hasfood = bool(state['ant_hasfood'][i])
+            ant.final_path_length = int(state['ant_final_path_length'][i])
+            ant.moves = bytearray(state['ant_moves'][offsets[i]:offsets[i + 1]].tobytes())
+            ant.visited = bytearray(state['ant_visited'][i].tobytes())
+            self.ants.append(ant)
+
     def update(self, timestep):
         """
         Update the positions of all ants and pheromones in the grid.
         """
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
         if timestep % self.WaveTimesteps == 0:
             self.spawn_ants()
-
-        self.pheromones *= (1-decay_rate)
+        if profiler is not None:
+            profiler.lap('spawn')
+
+        self.pheromone_store.decay(decay_rate)
+        timed = profiler is not None
+        if timed:
+            profiler.lap('decay')
+        carrying = 0
+        delivered = 0
+        backtracks = 0
         for ant in self.ants:
-            ant.step(0.1)  # Update position and direction
+            outcome = ant.step(0.1)  # Update position and direction
+            if timed:
+                profiler.lap('deposit' if outcome == step_return else 'movement')
+                backtracks += outcome == step_backtrack
             # Check if an ant has found the food
-            if ant.hasfood and (ant.position[0], ant.position[1]) == self.colony_position:
+            if ant.hasfood and ant.cell == ant.colony_cell:
                 self.food_discovered = True
-                self.food_found += 1  # Increment the food delivered count
-                ant.hasfood = False
-                ant.visited = {}
-                ant.visited[str(ant.position)] = True
-                ant.path = []
-                ant.path.append(ant.position)
+                delivered += 1
+                ant.reset_memory()
                 ant.time_since_last_update = 0.0
+            carrying += ant.hasfood
+            if timed:
+                profiler.lap('delivery')
+        self.food_found += delivered  # Increment the food delivered count
+        self.ants_with_food = carrying
+        if timed:
+            profiler.count('timesteps')
+            profiler.count('ant_steps', len(self.ants))
+            profiler.count('backtracks', backtracks)
+            profiler.count('deliveries', delivered)
+        if self.recorder is not None:
+            self.recorder.record(timestep, self)
+
+
+@functools.lru_cache(maxsize=None)
+def empty_bitmap(size):
+    """
+    Zero bytes of a visited bitmap of size bytes, shared by all ants that clear one.
+    """
+    return bytes(size)
 
 
 class Ant:
-    def __init__(self, maze, pheromones, colony_position):
+    def __init__(self, maze_index, pheromones, colony_position, rng=None, max_moves=sys.maxsize):
         """
         Class to model the ants. Each ant is initialized with a position and direction.
+        Cells are addressed by their id in the maze index, the visited cells are kept
+        in a bitmap and the path as a stack of directions taken from the colony.
+        All ants of a run share its random stream rng. A searching ant turns back once
+        its path has max_moves moves (see wander_limit).
         """
-        self.position = colony_position
         self.colony_position = colony_position
         self.has_moved_away = False
-        self.grid = maze
-        self.visited = {}
-        self.visited[str(self.position)] = True
-        self.path = []
-        self.path.append(self.position)
+        self.maze_index = maze_index
+        self.adjacency = maze_index.adjacency
+        self.neighbor_lists = maze_index.neighbor_lists
+        self.cell_types = maze_index.cell_type_list
+        self.pheromone_values = pheromones.values
+        self.colony_cell = maze_index.cell_of(colony_position)
+        self.cell = self.colony_cell
+        self.visited = bytearray((maze_index.n_cells + 7) // 8)
+        self.moves = bytearray()
+        self.reset_memory()
         self.final_path_length = 0
         self.time_since_last_update = 0.0
-        self.hasfood = False
         self.pheromones = pheromones
+        self.rng = rng
+        self.max_moves = max_moves
+
+    @property
+    def position(self):
+        """
+        Position of the ant as (x, y).
+        """
+        return self.maze_index.positions[self.cell]
+
+    @property
+    def path(self):
+        """
+        Cells on the path from the colony to the ant as a list of (x, y).
+        """
+        cell = self.colony_cell
+        path = [self.maze_index.positions[cell]]
+        for direction in self.moves:
+            cell = self.neighbor_lists[cell][direction]
+            path.append(self.maze_index.positions[cell])
+        return path
+
+    def reset_memory(self):
+        """
+        Drop the food and forget the path and visited cells, keeping only the current cell.
+        """
+        self.hasfood = False
+        # Cleared in place, a delivery does not allocate a new bitmap
+        self.visited[:] = empty_bitmap(len(self.visited))
+        self.visited[self.cell >> 3] |= 1 << (self.cell & 7)
+        self.moves.clear()
 
     def get_adjacent_cells(self):
         """
-        Get the adjacent cells of the ant in the grid.
+        Get the open adjacent cells of the ant as (direction, cell) pairs.
         """
-        x, y = self.position
-        adj_cells = [(x, y + 1), (x + 1, y), (x, y - 1), (x - 1, y)]
-        return adj_cells
+        return self.adjacency[self.cell]
 
     def choose_cells_based_on_pheromones(self, adj_cells):
         """
-        Choose one of adjecent cells based on pheromone level
+        Choose one of adjecent cells based on pheromone level.
+        Returns the chosen (direction, cell) pair or None.
         """
-        # Remove cells that are walls
-        adj_cells = [cell for cell in adj_cells if self.grid[cell[0], cell[1]] != wall]
+        visited = self.visited
         # Remove cells that are visited
-        adj_cells = [cell for cell in adj_cells if str(cell) not in self.visited.keys()]
+        adj_cells = [option for option in adj_cells if not visited[option[1] >> 3] & (1 << (option[1] & 7))]
 
         if len(adj_cells) == 0:
-            return False
+            return None
 
         total_chance = 0
-        for cell in adj_cells:
-            total_chance += self.pheromones[cell[0], cell[1]] + base_chance
+        for direction, cell in adj_cells:
+            total_chance += self.pheromone_values[cell] + base_chance
 
+        # With a random stream every choice takes exactly one number, like in the vectorized engines
+        rng = self.rng
         if total_chance == len(adj_cells)*base_chance:
             # Nothing happens, no pheromones
+            if rng is not None:
+                return adj_cells[int(rng.random()*len(adj_cells))]
             np.random.shuffle(adj_cells)
             return adj_cells[0]
         # Pick a random number between 0 and the total pheromones
-        pheromone_pick  = np.random.uniform(0, total_chance)
+        if rng is not None:
+            pheromone_pick = rng.random()*total_chance
+        else:
+            pheromone_pick  = np.random.uniform(0, total_chance)
         current_chance = 0
         # Pick the cell based on pheromone_pick
-        for cell in adj_cells:
-            current_chance += self.pheromones[cell[0], cell[1]] + base_chance
+        for option in adj_cells:
+            current_chance += self.pheromone_values[option[1]] + base_chance
             if current_chance >= pheromone_pick:
-                return cell
+                return option
 
-        return False
+        return None
 
     def step(self, dt):
-        """Update the ant's state for the given time step."""
+        """Update the ant's state for the given time step, returns the outcome (step_forward, ...)."""
         self.time_since_last_update += dt
-        x, y = self.position
-        current_cell_value = self.grid[x, y]
+        cell = self.cell
+        current_cell_value = self.cell_types[cell]
         # Check if the ant found food
         if current_cell_value == food:
             self.hasfood = True
 
         if self.hasfood:
-            if self.position == self.colony_position:
-                self.hasfood = False
-                self.visited = {}
-                self.visited[str(self.position)] = True
-                self.path = []
-                self.path.append(self.position)
-                return
+            if cell == self.colony_cell:
+                self.reset_memory()
+                return step_stay
             elif current_cell_value == food:
-                self.final_path_length = len(self.path)
+                self.final_path_length = len(self.moves) + 1
             elif current_cell_value >= 0 and current_cell_value < 1:
                 # Calculate the pheromone deposit based on the path length
-                current_pheromone_deposit = pheromone_deposit*(((len(self.path)/self.final_path_length) / decay_strength)**2)
-                self.pheromones[x, y] = min(self.pheromones[x, y] +  current_pheromone_deposit , max_pheromone)
-        else:
+                current_pheromone_deposit = pheromone_deposit*((((len(self.moves) + 1)/self.final_path_length) / decay_strength)**2)
+                self.pheromones.add(cell, current_pheromone_deposit, max_pheromone)
+        elif len(self.moves) < self.max_moves:
             adj_cells = self.get_adjacent_cells()
             # Choose the next cell based on pheromones
-            cell = self.choose_cells_based_on_pheromones(adj_cells)
-            if cell != False:
-                self.position = cell
-                self.visited[str(self.position)] = True
-                self.path.append(self.position)
+            option = self.choose_cells_based_on_pheromones(adj_cells)
+            if option is not None:
+                direction, self.cell = option
+                self.visited[self.cell >> 3] |= 1 << (self.cell & 7)
+                self.moves.append(direction)
                 self.time_since_last_update = 0.0
-                return
+                return step_forward
         # Move back to the colony along the path
-        self.path.pop()
-        if len(self.path) > 0:
-            self.position = self.path[-1]
         self.time_since_last_update = 0.0
-        return
+        if len(self.moves) > 0:
+            self.cell = self.neighbor_lists[self.cell][opposite(self.moves.pop())]
+            return step_return if self.hasfood else step_backtrack
+        return step_stay
 
 class Visualization:
-    def __init__(self, maze, pheromones, height, width, pauseTime=0.01):
+    def __init__(self, maze, pheromones, height, width, pauseTime=0.01, render_every=1, target_fps=None,
+                 blit=True, export_path=None):
         """
         This visualization uses separate scatter plots for ants to preserve colony and food colors.
+        Only every render_every-th timestep is drawn, and with target_fps at most that many frames
+        per second, so the simulation runs ahead of the screen. With blitting only the pheromones,
+        ants and title are redrawn. With export_path the frames are rendered offscreen (Agg) and
+        written to a video (.mp4, .gif) or to a folder of .png images instead of a window.
         """
         self.h = height
         self.w = width
         self.pauseTime = pauseTime
-        self.grid = maze.copy()
+        self.render_every = render_every
+        self.target_fps = target_fps
+        self.last_render = None
+        self.export_path = export_path
+        self.writer = None
+        self.frame = 0
+        # The maze is only drawn, imshow keeps a reference instead of a copy
+        self.grid = maze
         self.pheromones = pheromones
         from matplotlib.colors import ListedColormap
+        if export_path is None:
+            self.figure = plt.gcf()
+            # Blitting needs a canvas that can copy regions
+            self.blit = blit and self.figure.canvas.supports_blit
+        else:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            self.figure = Figure()
+            FigureCanvasAgg(self.figure)
+            # Saved frames are drawn in full, blitting would leave out the animated artists
+            self.blit = False
+        self.ax = self.figure.gca()
         colors = [
             "yellow",  # -1 colony
             "white",   # 0 open spaces
@@ -239,48 +480,116 @@ class Visualization:
         ]
         # Adjusted color indices to match the grid values
         custom_cmap = ListedColormap(colors)
-        self.im = plt.imshow(self.grid, vmin=-1, vmax=2, cmap=custom_cmap)
-
-        # Initialize scatter plots for ants
-        self.ants_without_food_scatter = plt.scatter([], [], color='red', marker='o', s=25, zorder=3)
-        self.ants_with_food_scatter = plt.scatter([], [], color='purple', marker='o', s=25, zorder=3)
+        self.im = self.ax.imshow(self.grid, vmin=-1, vmax=2, cmap=custom_cmap)
+
+        # The pheromone overlay and the ants change every frame, with blitting they are drawn separately
+        self.ph_im = self.ax.imshow(self.pheromones, alpha=0.5, cmap='hot', vmin=0, vmax=max_pheromone, animated=self.blit)
+        self.ants_without_food_scatter = self.ax.scatter([], [], color='red', marker='o', s=25, zorder=3, animated=self.blit)
+        self.ants_with_food_scatter = self.ax.scatter([], [], color='purple', marker='o', s=25, zorder=3, animated=self.blit)
+        self.title = self.ax.set_title('Ant Simulation', animated=self.blit)
+
+        self.background = None
+        if self.blit:
+            # The static background is copied after every full draw, for example after resizing
+            self.figure.canvas.mpl_connect('draw_event', self.store_background)
+            plt.show(block=False)
+            plt.pause(self.pauseTime)
+
+    def store_background(self, event=None):
+        self.background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        for artist in (self.ph_im, self.ants_without_food_scatter, self.ants_with_food_scatter, self.title):
+            self.figure.draw_artist(artist)
+
+    def should_render(self, t):
+        """
+        Whether timestep t is drawn.
+        """
+        if t % self.render_every != 0:
+            return False
+        if self.target_fps is not None and self.export_path is None and self.last_render is not None:
+            return time.perf_counter() - self.last_render >= 1/self.target_fps
+        return True
 
-        self.ph_im = None
-        plt.title('Ant Simulation')
+    def render_model(self, t, model):
+        """
+        Draw a model at timestep t if the timestep is rendered, the positions and pheromones are
+        only gathered for rendered timesteps.
+        """
+        if not self.should_render(t):
+            return
+        ant_without_food_positions, ant_with_food_positions = model.ant_positions()
+        self.update(t, ant_without_food_positions, ant_with_food_positions, model.pheromones, force=True)
 
-    def update(self, t, ant_without_food_positions, ant_with_food_positions):
+    def update(self, t, ant_without_food_positions, ant_with_food_positions, pheromones=None, force=False):
         """
         Updates the visualization with pheromones and ant positions using scatter plots.
+        Positions are lists or arrays of (x, y), timesteps that are not rendered are skipped unless forced.
         """
+        if not force and not self.should_render(t):
+            return
+        self.last_render = time.perf_counter()
+        if pheromones is not None:
+            self.pheromones = pheromones
         # Update pheromones overlay
-        if self.ph_im is None:
-            self.ph_im = plt.imshow(self.pheromones, alpha=0.5, cmap='hot', vmin=0, vmax=max_pheromone)
-        else:
-            self.ph_im.set_data(self.pheromones)
+        self.ph_im.set_data(self.pheromones)
 
         # Update ant positions
         # Convert positions to (x, y) coordinates for scatter plot (inverting rows and columns)
-        if ant_without_food_positions:
-            x_no_food = [y for x, y in ant_without_food_positions]
-            y_no_food = [x for x, y in ant_without_food_positions]
-            self.ants_without_food_scatter.set_offsets(np.column_stack((x_no_food, y_no_food)))
+        self.ants_without_food_scatter.set_offsets(np.asarray(ant_without_food_positions, dtype=float).reshape(-1, 2)[:, ::-1])
+        self.ants_with_food_scatter.set_offsets(np.asarray(ant_with_food_positions, dtype=float).reshape(-1, 2)[:, ::-1])
+
+        self.title.set_text('t = %i' % t)
+        if self.export_path is not None:
+            self.export_frame()
+        elif self.blit and self.background is not None:
+            canvas = self.figure.canvas
+            canvas.restore_region(self.background)
+            self.draw_animated()
+            canvas.blit(self.figure.bbox)
+            canvas.flush_events()
         else:
-            # Use empty 2D array when no positions
-            self.ants_without_food_scatter.set_offsets(np.empty((0, 2)))
+            plt.draw()
+            plt.pause(self.pauseTime)
 
-        if ant_with_food_positions:
-            x_with_food = [y for x, y in ant_with_food_positions]
-            y_with_food = [x for x, y in ant_with_food_positions]
-            self.ants_with_food_scatter.set_offsets(np.column_stack((x_with_food, y_with_food)))
+    def export_frame(self):
+        """
+        Write the current frame to the video or image folder of export_path.
+        """
+        import os
+        import matplotlib.animation
+        if self.export_path.endswith(('.mp4', '.gif')):
+            if self.writer is None:
+                fps = self.target_fps or 30
+                if self.export_path.endswith('.gif'):
+                    self.writer = matplotlib.animation.PillowWriter(fps=fps)
+                else:
+                    self.writer = matplotlib.animation.FFMpegWriter(fps=fps)
+                self.writer.setup(self.figure, self.export_path)
+            self.writer.grab_frame()
         else:
-            # Use empty 2D array when no positions
-            self.ants_with_food_scatter.set_offsets(np.empty((0, 2)))
+            os.makedirs(self.export_path, exist_ok=True)
+            self.figure.savefig(os.path.join(self.export_path, f'frame_{self.frame:06d}.png'))
+        self.frame += 1
 
-        plt.title('t = %i' % t)
-        plt.draw()
-        plt.pause(self.pauseTime)
+    def close(self):
+        """
+        Finish an export.
+        """
+        if self.writer is not None:
+            self.writer.finish()
+            self.writer = None
 
     def persist(self):
+        if self.export_path is not None:
+            self.close()
+            return
+        if self.blit:
+            # Show the last frame in full, so the window can be resized and saved
+            for artist in (self.ph_im, self.ants_without_food_scatter, self.ants_with_food_scatter, self.title):
+                artist.set_animated(False)
         plt.show()
 
 
@@ -288,17 +597,22 @@ if __name__ == '__main__':
     """
     Simulation parameters
     """
+    # Draw every render_every-th timestep, at most target_fps frames per second (None for no limit)
+    render_every = 1
+    target_fps = 30
+    # Write the frames to a video (.mp4, .gif) or a folder of .png images instead of showing them
+    export_path = None
+
     timeSteps = ntimeSteps
     t = 0
     maze = generate_maze_with_paths(maze_dimention, maze_dimention, nPaths)
     maze = upscale_maze(maze, maze_scale)
     sim = Model(maze, len(maze[0]), len(maze))
-    vis = Visualization(maze, sim.pheromones, sim.height, sim.width)
+    vis = Visualization(maze, sim.pheromones, sim.height, sim.width, render_every=render_every,
+                        target_fps=target_fps, export_path=export_path)
     print('Starting simulation')
     while t < timeSteps and not sim.food_found > ants_with_food_returned -1:
         food_found = sim.update(t)  # Update simulation
-        ant_without_food_positions = [ant.position for ant in sim.ants if not ant.hasfood]
-        ant_with_food_positions = [ant.position for ant in sim.ants if ant.hasfood]
-        vis.update(t, ant_without_food_positions, ant_with_food_positions)
+        vis.render_model(t, sim)
         t += 1
     vis.persist()
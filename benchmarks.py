@@ -0,0 +1,321 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+import ant_model_walkback as amw
+import jit_kernel
+from engines import create_model
+from ensemble_model import EnsembleModel
+from maze_generator_with_nPaths import generate_maze_with_paths, upscale_maze
+from results_io import write_result
+from rng_streams import replicate_stream
+from sweep_scheduler import make_spec, build_maze, run_sweep, run_stream
+
+# Baseline the results are compared with and stored to with --save
+baseline_path = 'benchmark_baseline.json'
+
+# A benchmark that takes more than (1 + tolerance) times its baseline time is a regression
+tolerance = 0.2
+
+# Groups of benchmarks, run in this order
+groups = ('maze', 'update', 'run', 'sweep', 'parsing')
+
+# Root seed and maze seed of the runs, fixed so every benchmark run simulates the same thing
+root_seed = 20240101
+maze_seed = 16436
+
+
+def machine_info():
+    """
+    The machine and library versions the benchmarks ran on.
+    """
+    return {'platform': platform.platform(), 'processor': platform.processor() or platform.machine(),
+            'cpus': os.cpu_count(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'numba': jit_kernel.numba.__version__ if jit_kernel.numba is not None else None,
+            'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def available_engines():
+    """
+    Single run engines to benchmark, 'jit' only when numba is installed.
+    """
+    return ['python', 'vectorized'] + (['jit'] if jit_kernel.numba is not None else [])
+
+
+def best_time(function, repeat=5):
+    """
+    Shortest of repeat timings of function().
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_maze(quick=False):
+    """
+    Maze generation and upscaling for a few maze sizes.
+    """
+    results = {}
+    for dimension in (31, 61) if quick else (31, 61, 121):
+        results[f'generate_maze {dimension}'] = best_time(lambda: generate_maze_with_paths(dimension, dimension, 16, randomseed=maze_seed))
+    maze = generate_maze_with_paths(61, 61, 16, randomseed=maze_seed)
+    results['upscale_maze 61x4'] = best_time(lambda: upscale_maze(maze, 4))
+    return results
+
+
+def make_model(engine, dimension, nAnts, replicate=0, **parameters):
+    """
+    Model on the benchmark maze of the given size, with its own random stream.
+    """
+    amw.set_parameters(maze_dimention=dimension, nAnts=nAnts, **parameters)
+    maze = upscale_maze(generate_maze_with_paths(dimension, dimension, 16, randomseed=maze_seed), 1)
+    return create_model(maze, len(maze[0]), len(maze), engine, replicate_stream(root_seed, [dimension, nAnts], replicate))
+
+
+def benchmark_update(quick=False):
+    """
+    Time per update with all ants spawned, after a warm-up that builds up pheromones,
+    for several ant counts and maze sizes.
+    """
+    configurations = [(31, 100), (31, 400), (61, 400)] if quick else [(31, 50), (31, 200), (31, 800), (61, 200), (121, 200)]
+    results = {}
+    for engine in available_engines():
+        for dimension, nAnts in configurations:
+            sim = make_model(engine, dimension, nAnts, nWaveAnts=nAnts, pheromone_deposit=0.5, decay_rate=0.2,
+                             ants_with_food_returned=10**9)
+            steps = 50 if quick else 100
+            for t in range(200):
+                sim.update(t)
+            t = 200
+
+            def block():
+                nonlocal t
+                for _ in range(steps):
+                    sim.update(t)
+                    t += 1
+
+            results[f'update {engine} ants={nAnts} maze={dimension}'] = best_time(block)/steps
+    return results
+
+
+def benchmark_run(quick=False):
+    """
+    Full runs until ants_with_food_returned food is delivered.
+    """
+    results = {}
+    target = 50 if quick else 100
+    for engine in available_engines():
+        def full_run():
+            sim = make_model(engine, 31, 100, nWaveAnts=1, pheromone_deposit=0.5, decay_rate=0.2,
+                             ants_with_food_returned=target)
+            t = 0
+            while t < 10000 and sim.food_found < target:
+                sim.update(t)
+                t += 1
+
+        results[f'run {engine} to {target} food'] = best_time(full_run, 1 if quick else 3)
+    return results
+
+
+def sweep_run(spec):
+    """
+    Run function of the sweep benchmark.
+    """
+    maze = build_maze(spec)
+    sim = create_model(maze, len(maze[0]), len(maze), spec['engine'], run_stream(spec))
+    for t in range(spec['nStop']):
+        sim.update(t)
+    return {'food_found': sim.food_found}
+
+
+def benchmark_sweep(quick=False):
+    """
+    Wall time of a small sweep on two worker processes, including the pool start up.
+    """
+    amw.set_parameters(maze_dimention=31, nAnts=100, nWaveAnts=1, pheromone_deposit=0.5, decay_rate=0.2)
+    specs = []
+    for i in range(4 if quick else 8):
+        spec = make_spec(f'benchmark {i}', maze_seed, 300)
+        spec['engine'] = 'python'
+        spec['root_seed'] = root_seed
+        spec['replicate'] = i
+        specs.append(spec)
+    return {f'sweep {len(specs)} runs': best_time(lambda: run_sweep(sweep_run, specs, 2, progress=False), 1)}
+
+
+def benchmark_parsing(quick=False):
+    """
+    Reading and aggregating result files with Visualizations_statistical_tests, in both formats.
+    """
+    import Visualizations_statistical_tests as vst
+    n_runs = 10 if quick else 40
+    nStop = 2000
+    rng = np.random.default_rng(maze_seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for output_format, extension in (('text', '.txt'), ('binary', '.npz')):
+            sub_folder = os.path.join(folder, output_format)
+            os.makedirs(sub_folder)
+            for i in range(n_runs):
+                food_found = np.cumsum(rng.random(nStop) < 0.05).astype(np.int32)
+                data = {'timestep': np.arange(nStop, dtype=np.int32), 'food_found': food_found,
+                        'ants_food': rng.integers(0, 50, nStop, dtype=np.int32)}
+                metadata = dict(amw.get_parameters(), iteration=i, seed=maze_seed, nStop=nStop, baseline=False)
+                write_result(os.path.join(sub_folder, f'simulation_results{i + 1}{extension}'), metadata, data, output_format)
+            results[f'aggregate {n_runs} {output_format} runs'] = best_time(lambda: vst.aggregate_groups(folder, [output_format]))
+            path = os.path.join(sub_folder, f'simulation_results1{extension}')
+            results[f'load_run {output_format}'] = best_time(lambda: vst.load_run(path))
+    return results
+
+
+benchmarks = {'maze': benchmark_maze, 'update': benchmark_update, 'run': benchmark_run, 'sweep': benchmark_sweep,
+              'parsing': benchmark_parsing}
+
+
+def series_digest(series):
+    """
+    Short hash of a time series, to compare outcomes without storing them.
+    """
+    return hashlib.sha1(np.asarray(series, dtype=np.int64).tobytes()).hexdigest()[:16]
+
+
+def correctness_check(steps=800):
+    """
+    Run the same fixed-seed simulation on every engine and check that the fast engines give the
+    same food found, ants carrying food and pheromones as the python engine. Also returns the
+    outcomes of the python engine, on a random stream and on the global numpy random state,
+    so a change of the reference behavior shows up against the baseline.
+    """
+    parameters = dict(nWaveAnts=1, pheromone_deposit=0.5, decay_rate=0.2, ants_with_food_returned=10**9)
+
+    def trajectory(sim):
+        series = []
+        for t in range(steps):
+            sim.update(t)
+            series.append((sim.food_found, sim.count_ants_with_food()))
+        return series
+
+    reference = []
+    for replicate in range(2):
+        sim = make_model('python', 31, 100, replicate, **parameters)
+        reference.append((trajectory(sim), sim.pheromones.copy()))
+
+    matches = {}
+    for engine in available_engines()[1:]:
+        sim = make_model(engine, 31, 100, 0, **parameters)
+        series = trajectory(sim)
+        matches[engine] = series == reference[0][0] and np.array_equal(sim.pheromones, reference[0][1])
+
+    # The ensemble engine runs both replicates at once
+    amw.set_parameters(maze_dimention=31, nAnts=100, **parameters)
+    maze = upscale_maze(generate_maze_with_paths(31, 31, 16, randomseed=maze_seed), 1)
+    sim = EnsembleModel(maze, len(maze[0]), len(maze), 2, [replicate_stream(root_seed, [31, 100], r) for r in range(2)])
+    food_found = []
+    for t in range(steps):
+        sim.update(t)
+        food_found.append(sim.food_found.copy())
+    food_found = np.array(food_found)
+    matches['ensemble'] = all(food_found[:, r].tolist() == [f for f, _ in reference[r][0]] for r in range(2))
+
+    # Python engine on the global numpy random state, as in the original model
+    np.random.seed(maze_seed)
+    amw.set_parameters(maze_dimention=31, nAnts=100, **parameters)
+    maze = upscale_maze(generate_maze_with_paths(31, 31, 16, randomseed=maze_seed), 1)
+    legacy = trajectory(amw.Model(maze, len(maze[0]), len(maze)))
+    outcomes = {'stream': {'food_found': reference[0][0][-1][0], 'digest': series_digest(reference[0][0])},
+                'legacy': {'food_found': legacy[-1][0], 'digest': series_digest(legacy)}}
+    return {'matches': matches, 'outcomes': outcomes}
+
+
+def compare(results, baseline, tolerance=tolerance):
+    """
+    Print every benchmark against the baseline, returns the names of the regressions.
+    """
+    regressions = []
+    print(f"{'benchmark':<40} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, seconds in results.items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            print(f"{name:<40} {'-':>10} {seconds:>10.4g}")
+            continue
+        ratio = seconds/reference
+        status = ''
+        if ratio > 1 + tolerance:
+            status = 'SLOWER'
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            status = 'faster'
+        print(f"{name:<40} {reference:>10.4g} {seconds:>10.4g} {ratio:>7.2f} {status}")
+    return regressions
+
+
+def run_benchmarks(selected=groups, quick=False):
+    """
+    Run the selected groups of benchmarks, returns the seconds per benchmark.
+    """
+    parameters = amw.get_parameters()
+    results = {}
+    try:
+        for group in selected:
+            print(f"Running {group} benchmarks")
+            results.update(benchmarks[group](quick))
+    finally:
+        amw.set_parameters(**parameters)
+    return results
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark the simulator and compare with a stored baseline')
+    parser.add_argument('--baseline', default=baseline_path, help='baseline JSON file')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=tolerance,
+                        help='allowed slow down as a fraction of the baseline time')
+    parser.add_argument('--only', nargs='+', choices=groups, default=list(groups), help='groups of benchmarks to run')
+    parser.add_argument('--quick', action='store_true', help='smaller benchmarks for a fast check')
+    args = parser.parse_args(arguments)
+
+    print("Checking the engines against the python engine")
+    check = correctness_check()
+    failed = [engine for engine, match in check['matches'].items() if not match]
+    for engine, match in check['matches'].items():
+        print(f"  {engine}: {'same results' if match else 'DIFFERENT results'}")
+
+    results = run_benchmarks(args.only, args.quick)
+    report = {'machine': machine_info(), 'quick': args.quick, 'correctness': check, 'results': results}
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline['machine']['platform'] != report['machine']['platform'] or baseline.get('quick') != args.quick:
+            print("Warning: the baseline was recorded on another machine or with other settings")
+        regressions = compare(results, baseline, args.tolerance)
+        if baseline['correctness']['outcomes'] != check['outcomes']:
+            print("The outcomes of the python engine differ from the baseline: "
+                  f"{baseline['correctness']['outcomes']} -> {check['outcomes']}")
+            failed.append('reference outcomes')
+    else:
+        print(f"No baseline at {args.baseline}")
+        compare(results, {'results': {}})
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} benchmarks are more than {100*args.tolerance:.0f}% slower than the baseline")
+    if failed:
+        print(f"Correctness check failed: {', '.join(failed)}")
+    return 1 if regressions or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
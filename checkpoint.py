@@ -0,0 +1,96 @@
+import json
+import os
+import numpy as np
+import ant_model_walkback as amw
+import pheromone_store
+from engines import create_model
+from results_io import checkpoint_suffix
+from rng_streams import BlockRandom
+
+# Entries of a model state that are numbers, the others are arrays
+state_scalars = ('total_ants_spawned', 'food_found', 'food_discovered', 'ants_with_food')
+
+
+def checkpoint_path(filename):
+    """
+    Checkpoint file of the run that writes its results to filename. It does not end in a result
+    extension, so readers of the result folder leave it out.
+    """
+    return filename + checkpoint_suffix
+
+
+def model_stream(model):
+    """
+    Random stream of a single run model, None when it uses the global numpy random state.
+    """
+    if hasattr(model, 'rngs'):
+        return model.rngs[0] if model.rngs is not None else None
+    return model.rng
+
+
+def save_checkpoint(path, model, timestep, engine='python', extras=None):
+    """
+    Write the state of a model after the update of timestep, with the simulation parameters,
+    the grid and the state of the random stream, so load_checkpoint continues the run as if
+    it never stopped. The arrays of the dictionary extras are stored with it, such as the time series so far.
+    The file is written under a temporary name first, a crash keeps the previous checkpoint.
+    """
+    state = model.get_state()
+    scalars = {name: int(state.pop(name)) for name in state_scalars}
+    metadata = {'engine': engine, 'timestep': int(timestep), 'parameters': amw.get_parameters(), 'state': scalars}
+    arrays = {f'state_{name}': np.asarray(values) for name, values in state.items()}
+    arrays.update({f'extra_{name}': np.asarray(values) for name, values in (extras or {}).items()})
+
+    rng = model_stream(model)
+    if rng is not None:
+        rng_state = rng.get_state()
+        metadata['rng'] = {'bit_generator': rng_state['bit_generator']}
+        arrays['rng_block'] = rng_state['block']
+    else:
+        name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+        metadata['legacy_rng'] = [name, position, has_gauss, cached_gaussian]
+        arrays['rng_keys'] = keys
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        np.savez_compressed(file, metadata=np.array(json.dumps(metadata)), grid=np.asarray(model.grid), **arrays)
+    os.replace(temporary_path, path)
+
+
+def read_checkpoint_metadata(path):
+    """
+    The metadata of a checkpoint: engine, timestep, parameters and the scalars of the state.
+    """
+    with np.load(path) as file:
+        return json.loads(str(file['metadata']))
+
+
+def load_checkpoint(path, engine=None):
+    """
+    Rebuild the model of a checkpoint, by default with the engine it was saved from.
+    Sets the simulation parameters and pheromone type of the checkpoint and, for runs on the
+    global numpy random state, that state. Returns the model, the last timestep it ran and the extra arrays.
+    """
+    with np.load(path) as file:
+        metadata = json.loads(str(file['metadata']))
+        arrays = {name: file[name] for name in file.files if name != 'metadata'}
+
+    amw.set_parameters(**metadata['parameters'])
+    pheromone_store.pheromone_dtype = arrays['state_pheromone_values'].dtype.name
+    rng = None
+    if 'rng' in metadata:
+        bit_generator_state = metadata['rng']['bit_generator']
+        bit_generator = getattr(np.random, bit_generator_state['bit_generator'])()
+        rng = BlockRandom(np.random.Generator(bit_generator))
+        rng.set_state({'bit_generator': bit_generator_state, 'block': arrays['rng_block']})
+
+    grid = arrays['grid']
+    model = create_model(grid, len(grid[0]), len(grid), engine or metadata['engine'], rng)
+    if rng is None:
+        name, position, has_gauss, cached_gaussian = metadata['legacy_rng']
+        np.random.set_state((name, arrays['rng_keys'], position, has_gauss, cached_gaussian))
+    state = dict(metadata['state'])
+    state.update({name[len('state_'):]: values for name, values in arrays.items() if name.startswith('state_')})
+    model.set_state(state)
+    extras = {name[len('extra_'):]: values for name, values in arrays.items() if name.startswith('extra_')}
+    return model, metadata['timestep'], extras
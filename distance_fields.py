@@ -0,0 +1,104 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
+import maze_index
+
+# Distance fields of mazes used before in this process, keyed by the maze and the two cells
+_fields_cache = {}
+
+# Maximum number of distance fields kept in the cache
+max_cached_fields = 16
+
+
+def bfs_distances(index, source):
+    """
+    Number of moves from the source cell to every cell of a maze index, -1 for cells that
+    can not be reached. A breadth first search over the open cell graph in compiled code.
+    """
+    indptr, indices, _ = index.csr
+    graph = csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr), shape=(index.n_cells, index.n_cells))
+    distances = shortest_path(graph, unweighted=True, indices=source)
+    return np.where(np.isinf(distances), -1, distances).astype(np.int32)
+
+
+class DistanceFields:
+    def __init__(self, from_colony, from_food, colony_cell, food_cell):
+        """
+        Shortest path distances in moves from the colony and from the food to every cell id.
+        """
+        self.from_colony = from_colony
+        self.from_food = from_food
+        self.colony_cell = colony_cell
+        self.food_cell = food_cell
+        # Moves on a shortest path from the colony to the food
+        self.optimal_length = int(from_colony[food_cell])
+
+    @classmethod
+    def for_cells(cls, index, colony_cell, food_cell):
+        """
+        Distance fields of a maze index, computed once per maze and kept with the maze in the disk
+        cache when the index has one (see maze_index.persistent_cache).
+        """
+        key = (index.key, colony_cell, food_cell) if index.key is not None else (id(index), colony_cell, food_cell)
+        if key not in _fields_cache:
+            if len(_fields_cache) >= max_cached_fields:
+                _fields_cache.pop(next(iter(_fields_cache)))
+
+            def build():
+                return {'from_colony': bfs_distances(index, colony_cell), 'from_food': bfs_distances(index, food_cell)}
+
+            if maze_index.persistent_cache is not None and index.key is not None:
+                arrays = maze_index.persistent_cache.derived(index.key, f'distances-{colony_cell}-{food_cell}',
+                                                             ('from_colony', 'from_food'), build)
+            else:
+                arrays = build()
+            _fields_cache[key] = cls(arrays['from_colony'], arrays['from_food'], colony_cell, food_cell)
+        return _fields_cache[key]
+
+    @classmethod
+    def for_model(cls, model):
+        """
+        Distance fields of the maze of a model, from its colony and food positions.
+        """
+        index = model.maze_index
+        return cls.for_cells(index, index.cell_of(model.colony_position), index.cell_of(model.food_position))
+
+
+def ant_metrics(model, fields=None):
+    """
+    Metrics of every spawned ant from its cell and path lengths, without looking at its path:
+    its distance to the food and from the colony, the optimality of its path (moves taken over
+    the shortest distance to its cell, 1 on a shortest path) and the efficiency of its last trail
+    to the food (shortest over found path length, nan for ants that never found food).
+    """
+    fields = DistanceFields.for_model(model) if fields is None else fields
+    cells, hasfood = model.ant_states()
+    moves, final_path_length = model.ant_path_lengths()
+    from_colony = fields.from_colony[cells]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        optimality = np.where(from_colony > 0, moves/from_colony, 1.0)
+        # The final path length counts the cells from the colony to the food, one more than the moves
+        trail_efficiency = np.where(final_path_length > 0, (fields.optimal_length + 1)/final_path_length, np.nan)
+    return {'distance_to_food': fields.from_food[cells], 'distance_from_colony': from_colony,
+            'optimality': optimality, 'trail_efficiency': trail_efficiency, 'hasfood': hasfood}
+
+
+def run_metrics(model, fields=None):
+    """
+    Summary of the ant metrics of a run as plain numbers, small enough to keep for every run of a sweep.
+    """
+    fields = DistanceFields.for_model(model) if fields is None else fields
+    metrics = ant_metrics(model, fields)
+    searching = ~metrics['hasfood']
+    efficiency = metrics['trail_efficiency'][~np.isnan(metrics['trail_efficiency'])]
+
+    def mean(values):
+        return float(values.mean()) if len(values) else None
+
+    return {'optimal_length': fields.optimal_length,
+            'mean_distance_to_food': mean(metrics['distance_to_food'][searching]),
+            'mean_optimality': mean(metrics['optimality']),
+            'ants_with_trail': len(efficiency),
+            'mean_trail_efficiency': mean(efficiency),
+            'median_trail_efficiency': float(np.median(efficiency)) if len(efficiency) else None,
+            'best_trail_efficiency': float(efficiency.max()) if len(efficiency) else None}
@@ -0,0 +1,21 @@
+from ant_model_walkback import Model
+from vectorized_model import VectorModel
+from jit_kernel import jit_model
+
+# Engines that implement the Model interface (update, food_found, pheromones)
+engines = {
+    'python': Model,
+    'vectorized': VectorModel,
+    # Compiled kernel, falls back to the python engine when numba is not installed
+    'jit': jit_model,
+}
+
+
+def create_model(maze, width, height, engine='python', rng=None):
+    """
+    Create a simulation model using the chosen engine.
+    rng is the random stream of the run (see rng_streams), None uses the global numpy random state.
+    """
+    if engine not in engines:
+        raise ValueError(f"Unknown engine '{engine}', choose from {list(engines)}")
+    return engines[engine](maze, width, height, rng=rng)
@@ -0,0 +1,59 @@
+import numpy as np
+import ant_model_walkback as amw
+from vectorized_model import VectorModel
+
+
+class EnsembleModel(VectorModel):
+    def __init__(self, maze, width, height, replicates, rng=None):
+        """
+        Run independent replicates of the same maze in one stacked model.
+        Every replicate has its own ants and pheromones, and stops being simulated
+        once it has returned ants_with_food_returned food.
+        rng is a list with the random stream of every replicate.
+        """
+        super().__init__(maze, width, height, replicates, rng)
+        # Food delivered per replicate
+        self.food_found = np.zeros(replicates, dtype=np.int64)
+        # Timestep at which each replicate reached the food target, -1 while running
+        self.finish_times = np.full(replicates, -1, dtype=np.int64)
+
+    @property
+    def pheromones(self):
+        """
+        Pheromone levels of all replicates stacked into a (replicates, height, width) array.
+        """
+        return np.stack([self.pheromone_store.dense(r).copy() for r in range(self.replicates)])
+
+    def count_ants_with_food(self):
+        """
+        Number of ants currently carrying food in each replicate.
+        """
+        carrying = np.flatnonzero(self.hasfood[:self.total_ants_spawned*len(self.lanes)])
+        return np.bincount(self.replicate_of(carrying), minlength=self.replicates)
+
+    def record_deliveries(self, slots):
+        """
+        Count the food delivered by the ants in the slots per replicate.
+        """
+        self.food_found += np.bincount(self.replicate_of(slots), minlength=self.replicates)
+
+    def update(self, timestep):
+        """
+        Update all running replicates and retire the ones that reached the food target.
+        """
+        super().update(timestep)
+        finished = self.lanes[self.food_found[self.lanes] > amw.ants_with_food_returned - 1]
+        if len(finished):
+            self.finish_times[finished] = timestep
+            self.retire(finished)
+
+    def run(self, nStop):
+        """
+        Run until every replicate reached the food target or nStop timesteps have passed.
+        Returns the finish time of each replicate, -1 for replicates that ran out of time.
+        """
+        t = 0
+        while t < nStop and len(self.lanes) > 0:
+            self.update(t)
+            t += 1
+        return self.finish_times
@@ -1,15 +1,18 @@
+import functools
 import matplotlib.pyplot as plt
-from maze_generator_with_nPaths import generate_maze_with_paths, upscale_maze
 import ant_model_walkback as amw
-from ant_model_walkback import Model
-import random
-import multiprocessing as mp
+from engines import create_model
+from ensemble_model import EnsembleModel
+from sweep_scheduler import make_spec, build_maze, run_sweep, run_stream, replicate_streams
+from adaptive_sweep import run_adaptive_sweep, print_summary
+from rng_streams import new_root_seed, derive_seeds
+from profiling import PhaseProfiler, print_profiles
+from work_queue import queue_root_seed, run_queued_sweep
 import time
 from scipy.stats import f_oneway
 
 # Set the parameters for the simulation
-# Make sure to define the simulation parameters here or in run_process,
-# as run_process won't have access to them otherwise
+# These are copied into the run specifications, which carry them to the worker processes
 amw.ntimeSteps = 2500
 amw.maze_dimention = 31
 amw.maze_scale = 1
@@ -17,6 +20,13 @@ amw.ants_with_food_returned = 500
 amw.nWaveAnts = 1
 amw.decay_rate = 0.2
 
+# Simulation engine, 'python', 'vectorized', 'jit' (needs numba, falls back to 'python') or 'ensemble'
+# The ensemble engine runs the iterations on one maze as replicates in a single process
+engine = 'python'
+
+# Number of worker processes, None uses all cores
+processes = None
+
 # List with times for each pheromone deposit rate
 deposit_rates = [0, 0.5]
 all_results = []
@@ -27,53 +37,141 @@ nPaths_list = [16, 32, 55, 120]
 # Number of iterations
 iteration = 7
 
+# Work queue folder shared by the hosts of the sweep, None runs it on a pool of this machine.
+# Workers join with python work_queue.py <queue_folder> (the adaptive mode always uses the pool)
+queue_folder = None
+
+# Time the phases of every update, a summary per run is printed with the sweep progress and
+# a table of the cost per ant-step against nPaths at the end (the ensemble engine is not profiled)
+profile = False
+
+# Root seed of the sweep, the maze seeds and the random stream of every run are derived from it,
+# so a sweep gives the same results for the same root seed however the runs are spread over workers.
+# None picks a new root seed when the sweep starts, it is printed so the sweep can be repeated
+root_seed = None
+
 # Maze seeds
 MAX_INT = 32**2 - 1
 nMazes = 10
-maze_seeds = [random.randint(0, MAX_INT) for i in range(nMazes)]
 
-def run():
-    start_time = time.time()
+# Adaptive mode, runs replicates of every (deposit rate, nPaths) cell until the confidence
+# interval of the mean foraging time is at most ci_width time steps wide
+adaptive = False
+ci_width = 200
+max_replicates = iteration*nMazes
 
-    # Collect results for boxplots
-    boxplot_data = {0: {nPaths: [] for nPaths in nPaths_list}, 0.5: {nPaths: [] for nPaths in nPaths_list}}
+def sweep_root_seed():
+    """
+    Root seed of a sweep that starts now, root_seed or a new one. It is drawn when the sweep
+    starts and passed to the specifications, so processes that import this module agree on it.
+    A queued sweep uses the root seed kept in its queue folder, so running it again reuses its results
+    """
+    if root_seed is not None:
+        return root_seed
+    return new_root_seed() if queue_folder is None else queue_root_seed(queue_folder)
 
-    # Colors for boxplots
-    deposit_colors = {0: "lightpink", 0.5: "lightgreen"}
+def maze_seeds(root_seed):
+    """
+    Seeds of the mazes of a sweep, derived from its root seed
+    """
+    return derive_seeds(root_seed, 'maze', nMazes, MAX_INT + 1)
 
-    for d_i, deposit_rate in enumerate(deposit_rates):
+def make_specs(root_seed):
+    """
+    Run specifications for every deposit rate, maze difficulty and maze
+    """
+    seeds = maze_seeds(root_seed)
+    specs = []
+    for deposit_rate in deposit_rates:
         # Only plot deposit rates 0 and 0.5
         if deposit_rate not in [0, 0.5]:
             continue
-        print(f'Starting simulation with pheromone deposit rate: {deposit_rate}')
-        print(f"{int(1/len(deposit_rates)*d_i*100)}% --- {time.time() - start_time} seconds ---")
-        amw.pheromone_deposit = deposit_rate
-
         # Different maze difficulties
         for nPaths in nPaths_list:
-            # Shared array to store the times for each iteration
-            shared_times = mp.Array('i', [-1] * iteration*nMazes)
-            # List to store the processes
-            processes = []
-            for i in range(iteration*nMazes):
-                # Create a new process for each iteration
-                p = mp.Process(target=run_process, args=(nPaths, shared_times, i, i//iteration))
-                processes.append(p)
-                p.start()
-
-            # Wait for all processes to finish
-            for p in processes:
-                p.join()
-
-            # Count the number of simulations that ran out of time
-            failed_count = 0
-            for t in enumerate(shared_times):
-                if t[1] == -1:
-                    failed_count += 1
-                    shared_times[t[0]] = amw.ntimeSteps
+            for j in range(nMazes):
+                if engine == 'ensemble':
+                    # One run holds all iterations on this maze as replicates
+                    spec = make_spec(f"deposit {deposit_rate}, paths {nPaths}, maze {j}", seeds[j], amw.ntimeSteps,
+                                     pheromone_deposit=deposit_rate, nPaths=nPaths)
+                    spec['replicates'] = iteration
+                    spec['engine'] = engine
+                    spec['root_seed'] = root_seed
+                    specs.append(spec)
+                    continue
+                for i in range(iteration):
+                    spec = make_spec(f"deposit {deposit_rate}, paths {nPaths}, maze {j}, iteration {i}", seeds[j],
+                                     amw.ntimeSteps, pheromone_deposit=deposit_rate, nPaths=nPaths)
+                    spec['engine'] = engine
+                    spec['root_seed'] = root_seed
+                    spec['replicate'] = i
+                    spec['profile'] = profile
+                    specs.append(spec)
+    return specs
+
+def make_replicate(cell, i, root_seed):
+    """
+    Run specification of replicate i of a (deposit rate, nPaths) cell for the adaptive mode,
+    the replicates cycle through the mazes of the sweep with root_seed
+    """
+    deposit_rate, nPaths = cell
+    j = i % nMazes
+    spec = make_spec(f"deposit {deposit_rate}, paths {nPaths}, maze {j}, replicate {i}", maze_seeds(root_seed)[j],
+                     amw.ntimeSteps, pheromone_deposit=deposit_rate, nPaths=nPaths)
+    if engine == 'ensemble':
+        spec['replicates'] = iteration
+        spec['replicate'] = i*iteration
+    else:
+        spec['replicate'] = i
+    spec['engine'] = engine
+    spec['root_seed'] = root_seed
+    spec['profile'] = profile
+    return spec
+
+def foraging_times(result):
+    """
+    Foraging times of a result, simulations that ran out of time count as taking all time steps
+    """
+    return [amw.ntimeSteps if t == -1 else t for t in result['times']]
 
+def run():
+    start_time = time.time()
+    seed = sweep_root_seed()
+    print(f"Root seed: {seed}")
+
+    # Collect results for boxplots
+    boxplot_data = {0: {nPaths: [] for nPaths in nPaths_list}, 0.5: {nPaths: [] for nPaths in nPaths_list}}
+
+    # Colors for boxplots
+    deposit_colors = {0: "lightpink", 0.5: "lightgreen"}
+
+    target = run_ensemble_process if engine == 'ensemble' else run_process
+    # Profiled runs as (spec, result) pairs
+    profiled_runs = []
+
+    def collect_profile(spec, result):
+        if 'profile' in result:
+            profiled_runs.append((spec, result))
+    if adaptive:
+        cells = [(deposit_rate, nPaths) for deposit_rate in deposit_rates if deposit_rate in [0, 0.5] for nPaths in nPaths_list]
+        summary = run_adaptive_sweep(target, cells, functools.partial(make_replicate, root_seed=seed), foraging_times, ci_width,
+                                     # An ensemble run gives iteration replicates
+                                     max_replicates=max_replicates // iteration if engine == 'ensemble' else max_replicates,
+                                     processes=processes, on_result=collect_profile)
+        print_summary(summary)
+        for (deposit_rate, nPaths), cell_summary in summary.items():
+            boxplot_data[deposit_rate][nPaths].extend(cell_summary['values'])
+    else:
+        specs = make_specs(seed)
+        if queue_folder is not None:
+            results = run_queued_sweep(target, specs, queue_folder, processes, on_result=collect_profile)
+        else:
+            results = run_sweep(target, specs, processes, on_result=collect_profile)
+        for spec, result in zip(specs, results):
             # Add times for current difficulty and deposit rate to boxplot
-            boxplot_data[deposit_rate][nPaths].extend(shared_times)
+            boxplot_data[spec['parameters']['pheromone_deposit']][spec['parameters']['nPaths']].extend(foraging_times(result))
+
+    if profiled_runs:
+        print_profiles(profiled_runs)
 
     # ANOVA test for statistical analysis
     for deposit_rate in [0, 0.5]:
@@ -103,14 +201,15 @@ def run():
     plt.legend(legend_colors, legend_labels, title='Deposit rates')
     plt.show()
 
-def run_process(nPaths, times, i, j):
-    new_seed = maze_seeds[j]
-    maze = generate_maze_with_paths(amw.maze_dimention, amw.maze_dimention, nPaths, randomseed=new_seed)
-    maze = upscale_maze(maze, amw.maze_scale)
-    sim = Model(maze, len(maze[0]), len(maze))
+def run_process(spec):
+    maze = build_maze(spec)
+    sim = create_model(maze, len(maze[0]), len(maze), spec['engine'], run_stream(spec))
+    if spec.get('profile'):
+        sim.profiler = PhaseProfiler()
 
     # Time of current iteration
     t = 0
+    finish_time = -1
 
     # Run the simulation for the current value of nPaths
     while t < amw.ntimeSteps:
@@ -118,11 +217,24 @@ def run_process(nPaths, times, i, j):
 
         # Check if enough ants have returned with food
         if sim.food_found > amw.ants_with_food_returned - 1:
-            times[i] = t
-            return
+            finish_time = t
+            break
 
         t += 1
 
+    result = {'times': [finish_time]}
+    if sim.profiler is not None:
+        result['profile'] = sim.profiler.summary()
+    return result
+
+def run_ensemble_process(spec):
+    maze = build_maze(spec)
+    sim = EnsembleModel(maze, len(maze[0]), len(maze), spec['replicates'], replicate_streams(spec))
+
+    # Run all iterations on this maze until they found enough food or ran out of time
+    finish_times = sim.run(amw.ntimeSteps)
+    return {'times': finish_times.tolist()}
+
 
 
 
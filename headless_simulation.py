@@ -1,12 +1,20 @@
-from maze_generator_with_nPaths import generate_maze_with_paths, upscale_maze
 import ant_model_walkback as amw
-from ant_model_walkback import Model
+from engines import create_model
+from sweep_scheduler import make_spec, build_maze, run_sweep, run_stream
+from results_io import TimeSeriesBuffer, background_writer, extensions, columns, read_run
+from results_catalog import ResultsCatalog
+from adaptive_sweep import run_adaptive_sweep, print_summary
+from rng_streams import new_root_seed
+from recorder import RunRecorder
+import pheromone_store
+from distance_fields import run_metrics
+from profiling import PhaseProfiler, print_profiles
+from checkpoint import checkpoint_path, save_checkpoint, load_checkpoint, read_checkpoint_metadata
+from work_queue import queue_root_seed, run_queued_sweep
 import os
-import multiprocessing as mp
 
 # Set the parameters for the simulation
-# Make sure to define the simulation parameters here or in run_process,
-# as run_process won't have access to them otherwise
+# These are copied into the run specifications, which carry them to the worker processes
 amw.nPaths = 16
 amw.maze_dimention = 31
 amw.maze_scale = 1
@@ -18,8 +26,63 @@ amw.food_position = ((amw.maze_dimention*amw.maze_scale)-amw.maze_scale-1, (amw.
 amw.max_pheromone = 0.99
 amw.ants_with_food_returned = 2000
 
-def run(tempFileName='simulation_results', folder_name="sim_results", subfolder_name="decay_0.0",
-        initialRandomseed=16436, nStop=2000, iterations=20, deposit=0, decay=0):
+# Simulation engine, 'python', 'vectorized' or 'jit' (needs numba, falls back to 'python')
+engine = 'python'
+
+# Number of worker processes, None uses all cores
+processes = None
+
+# Root seed of the random streams of the runs, the results are the same for the same root seed
+# however the runs are spread over workers. None picks a new one when a sweep starts, it is printed
+# and written with the results
+root_seed = None
+
+# Output format of the results, 'binary' (.npz) or 'text' (.txt)
+output_format = 'binary'
+
+# Catalog of the results, runs are added as they finish. None disables it
+catalog_path = os.path.join('sim_results', 'catalog.sqlite')
+
+# Record the pheromones and ants every record_every-th timestep next to the results (None records nothing),
+# the recordings can be replayed with replay.py. Pheromones are stored as record_dtype
+record_every = None
+record_dtype = 'float16'
+
+# Save the state of a run every checkpoint_every timesteps next to its results, None (the default)
+# saves none, set it for long runs and sweeps that may be interrupted. The checkpoint is removed
+# when the results are written unless keep_checkpoints is set.
+# A kept checkpoint lets a later sweep with a larger nStop extend the run
+checkpoint_every = None
+keep_checkpoints = False
+
+# Resume an interrupted sweep: runs with results are skipped, runs with a checkpoint continue from it
+resume = False
+
+# Storage of the pheromone levels, 'float64' (reference results) or 'float32' (half the memory),
+# and tiled_pheromones only takes memory for the parts of the maze that received pheromone, for huge mazes
+pheromone_dtype = 'float64'
+tiled_pheromones = False
+
+# Add path metrics against the shortest colony-food path to the results of every run: trail
+# efficiency of the ants that found food, path optimality and distance to the food of the ants
+path_metrics = True
+
+# Time the phases of every update and count ant-steps, backtracks and deliveries, the summary
+# of every run is printed with the sweep progress and written into its metadata
+profile = False
+
+# Run the sweep through a work queue in this folder instead of a pool on this machine, None uses the pool.
+# The folder must be shared by the hosts, workers join from the same working directory with
+# python work_queue.py <queue_folder>, processes workers also run on this host
+queue_folder = None
+
+# Adaptive mode, runs iterations of every deposit rate until the confidence interval of the
+# mean food found at the end is at most ci_width wide, with at most max_iterations iterations
+adaptive = False
+ci_width = 20
+max_iterations = 100
+
+def make_folders(folder_name, subfolder_name):
     # Create the folder if it doesn't exist
     if not os.path.exists(folder_name):
         os.makedirs(folder_name)
@@ -34,53 +97,226 @@ def run(tempFileName='simulation_results', folder_name="sim_results", subfolder_
     else:
         print(f"Folder '{sub_folder_path}' already exists.")
 
-    processes = []
-    for i in range(iterations):
-        p = mp.Process(target=run_process, args=(tempFileName, folder_name, subfolder_name, initialRandomseed, nStop, i, deposit, decay))
-        processes.append(p)
-        p.start()
+def sweep_root_seed():
+    """
+    Root seed of a sweep that starts now, root_seed or a new one that is printed. It is drawn
+    when the sweep starts and passed to the specifications, so processes that import this module agree on it.
+    A queued sweep uses the root seed kept in its queue folder, so running it again reuses its results
+    """
+    if root_seed is not None:
+        return root_seed
+    seed = new_root_seed() if queue_folder is None else queue_root_seed(queue_folder)
+    print(f"Root seed: {seed}")
+    return seed
 
-    for p in processes:
-        p.join()
+def make_specs(tempFileName='simulation_results', folder_name="sim_results", subfolder_name="decay_0.0",
+               initialRandomseed=16436, nStop=2000, iterations=20, deposit=0, decay=0, engine=engine,
+               output_format=output_format, root_seed=None):
+    """
+    Run specifications for all iterations of one parameter setting, root_seed defaults to sweep_root_seed()
+    """
+    if root_seed is None:
+        root_seed = sweep_root_seed()
+    return [make_iteration_spec(i, tempFileName, folder_name, subfolder_name, initialRandomseed, nStop, deposit, decay,
+                                engine, output_format, root_seed) for i in range(iterations)]
+
+def make_iteration_spec(i, tempFileName='simulation_results', folder_name="sim_results", subfolder_name="decay_0.0",
+                        initialRandomseed=16436, nStop=2000, deposit=0, decay=0, engine=engine, output_format=output_format,
+                        root_seed=None):
+    """
+    Run specification of iteration i of one parameter setting, root_seed defaults to sweep_root_seed()
+    """
+    if root_seed is None:
+        root_seed = sweep_root_seed()
+    spec = make_spec(f"{subfolder_name}/{tempFileName}{i + 1}", initialRandomseed, nStop,
+                     pheromone_deposit=deposit, decay_rate=decay)
+    spec['iteration'] = i
+    spec['replicate'] = i
+    spec['root_seed'] = root_seed
+    spec['engine'] = engine
+    spec['output_format'] = output_format
+    spec['record_every'] = record_every
+    spec['record_dtype'] = record_dtype
+    spec['checkpoint_every'] = checkpoint_every
+    spec['keep_checkpoints'] = keep_checkpoints
+    spec['resume'] = resume
+    spec['profile'] = profile
+    spec['path_metrics'] = path_metrics
+    spec['pheromone_dtype'] = pheromone_dtype
+    spec['tiled_pheromones'] = tiled_pheromones
+    spec['filename'] = os.path.join(folder_name, subfolder_name, f"{tempFileName}{i + 1}{extensions[output_format]}")
+    return spec
+
+def run(tempFileName='simulation_results', folder_name="sim_results", subfolder_name="decay_0.0",
+        initialRandomseed=16436, nStop=2000, iterations=20, deposit=0, decay=0, engine=engine, processes=processes,
+        output_format=output_format):
+    make_folders(folder_name, subfolder_name)
+    specs = make_specs(tempFileName, folder_name, subfolder_name, initialRandomseed, nStop, iterations, deposit, decay, engine,
+                       output_format)
+    results = run_catalogued_sweep(specs, processes)
+    if profile:
+        print_profiles(zip(specs, results))
 
     print("All simulations finished.")
 
-def run_process(tempFileName, folder_name, subfolder_name, initialRandomseed, nStop, i, deposit, decay):
-    timeSteps = nStop
+def run_metadata(spec):
+    """
+    Metadata written with the results of a run
+    """
+    return dict(spec['parameters'], iteration=spec['iteration'], seed=spec['seed'], nStop=spec['nStop'],
+                engine=spec['engine'], baseline=spec['parameters']['pheromone_deposit'] == 0, root_seed=spec['root_seed'],
+                pheromone_dtype=spec.get('pheromone_dtype', 'float64'),
+                **{key: spec[key] for key in ('run_hash', 'code_version') if key in spec})
+
+def run_catalogued_sweep(specs, processes=processes, catalog_path=catalog_path):
+    """
+    Run the specifications and add every finished run to the results catalog
+    """
+    def sweep(on_result=None):
+        if queue_folder is not None:
+            return run_queued_sweep(run_process, specs, queue_folder, processes, on_result=on_result)
+        return run_sweep(run_process, specs, processes, on_result=on_result)
+
+    if catalog_path is None:
+        return sweep()
+    with ResultsCatalog(catalog_path) as catalog:
+        return sweep(catalog_recorder(catalog))
+
+def catalog_recorder(catalog):
+    """
+    Callback for run_sweep that adds finished runs to the catalog
+    """
+    def record(spec, result):
+        catalog.record_run(spec['filename'], run_metadata(spec), result['food_found'], result['timesteps'])
+    return record
+
+def run_adaptive(deposits, decay=0.2, folder_name="sim_results", initialRandomseed=16436, nStop=2000,
+                 processes=processes, catalog_path=catalog_path, root_seed=None):
+    """
+    Run iterations of every deposit rate until the mean food found at the end is known to within ci_width,
+    returns the summary of run_adaptive_sweep
+    """
+    if root_seed is None:
+        root_seed = sweep_root_seed()
+    for deposit_rate in deposits:
+        make_folders(folder_name, 'deposit'+str(deposit_rate))
+
+    def make_replicate(deposit_rate, i):
+        return make_iteration_spec(i, folder_name=folder_name, subfolder_name='deposit'+str(deposit_rate),
+                                   initialRandomseed=initialRandomseed, nStop=nStop, deposit=deposit_rate, decay=decay,
+                                   root_seed=root_seed)
+
+    def final_food_found(result):
+        return [result['food_found']]
+
+    catalog = ResultsCatalog(catalog_path) if catalog_path is not None else None
+    try:
+        summary = run_adaptive_sweep(run_process, deposits, make_replicate, final_food_found, ci_width,
+                                     max_replicates=max_iterations, processes=processes,
+                                     on_result=catalog_recorder(catalog) if catalog is not None else None)
+    finally:
+        if catalog is not None:
+            catalog.close()
+    print_summary(summary)
+    return summary
+
+def run_finished(spec, checkpoint):
+    """
+    Whether a resumed run has nothing left to do: its results exist and it has no checkpoint
+    or one that already reached nStop or the food target
+    """
+    if not os.path.exists(spec['filename']):
+        return False
+    if not os.path.exists(checkpoint):
+        return True
+    metadata = read_checkpoint_metadata(checkpoint)
+    return (metadata['timestep'] + 1 >= spec['nStop']
+            or metadata['state']['food_found'] >= metadata['parameters']['ants_with_food_returned'])
+
+def run_process(spec):
+    timeSteps = spec['nStop']
     t = 0
-    Maze = generate_maze_with_paths(amw.maze_dimention, amw.maze_dimention, amw.nPaths, randomseed=initialRandomseed)
-    Maze = upscale_maze(Maze, amw.maze_scale)
-    sim = Model(Maze, len(Maze[0]), len(Maze))
-
-    amw.pheromone_deposit = deposit
-    amw.decay_rate = decay
-
-    # Create the file
-    filename = os.path.join(folder_name, subfolder_name, f"{tempFileName}{i + 1}.txt")
-    with open(filename, "w") as file:
-        file.write(f"Simulation Iteration {i + 1}\n")
-        file.write(f"Maze Dimensions: {amw.maze_dimention}x{amw.maze_dimention}, Scale Factor: {amw.maze_scale}, Paths: {amw.nPaths}\n")
-        file.write(f"Number of Ants: {amw.nAnts}, Maximum Time Steps: {nStop}, Food Find Target: {amw.ants_with_food_returned}\n")
-        file.write(f"Initial Random Seed: {initialRandomseed}\n")
-        file.write(f"Pheromone decay rate: {amw.decay_rate}, Deposit rate: {amw.pheromone_deposit}, Max: {amw.max_pheromone}")
-        # Check if baseline
-        if amw.pheromone_deposit==0:
-            file.write("Baseline: True\n")
-        else:
-            file.write("Baseline: False")
-        file.write("Starting simulation\n\n")
-        file.write("Timestep, Food Found, AntsFood\n")
-        print('Starting simulation')
-        n = amw.ants_with_food_returned
-        while t < timeSteps and sim.food_found < n:
-            amw.food_found = sim.update(t)  # Update simulation
-            file.write(f"{t}, {sim.food_found}, {len([ant.hasfood for ant in sim.ants if ant.hasfood])}\n")
-            t += 1
+    checkpoint = checkpoint_path(spec['filename'])
+    resuming = spec.get('resume') and os.path.exists(checkpoint)
+    if spec.get('resume') and run_finished(spec, checkpoint):
+        data = read_run(spec['filename'])
+        return {'food_found': int(data['food_found'][-1]) if len(data['food_found']) else 0,
+                'timesteps': len(data['timestep'])}
+
+    pheromone_store.pheromone_dtype = spec.get('pheromone_dtype', 'float64')
+    pheromone_store.use_tiles = spec.get('tiled_pheromones', False)
+
+    # Record the time series in preallocated columns, the file is written in the background
+    series = TimeSeriesBuffer(timeSteps)
+    frames = 0
+    if resuming:
+        sim, t, extras = load_checkpoint(checkpoint, spec['engine'])
+        t += 1
+        for key, _ in columns:
+            series.data[key][:len(extras[key])] = extras[key]
+        series.length = len(extras['timestep'])
+        frames = int(extras.get('recorder_frames', 0))
+    else:
+        Maze = build_maze(spec)
+        sim = create_model(Maze, len(Maze[0]), len(Maze), spec['engine'], run_stream(spec))
+
+    recorder = None
+    if spec.get('record_every'):
+        recorder = RunRecorder(os.path.splitext(spec['filename'])[0] + '_recording', sim, timeSteps,
+                               spec['record_every'], spec['record_dtype'], amw.max_pheromone, frames)
+        sim.recorder = recorder
+    if spec.get('profile'):
+        sim.profiler = PhaseProfiler()
+
+    def save(timestep):
+        extras = series.columns()
+        if recorder is not None:
+            extras['recorder_frames'] = recorder.frames
+        save_checkpoint(checkpoint, sim, timestep, spec['engine'], extras)
+
+    every = spec.get('checkpoint_every')
+    n = amw.ants_with_food_returned
+    while t < timeSteps and sim.food_found < n:
+        sim.update(t)  # Update simulation
+        series.append(t, sim.food_found, sim.count_ants_with_food())
+        t += 1
+        if every and t % every == 0 and t < timeSteps:
+            save(t - 1)
+
+    if recorder is not None:
+        recorder.close()
+    metadata = run_metadata(spec)
+    result = {'food_found': sim.food_found, 'timesteps': t}
+    if sim.profiler is not None:
+        metadata['profile'] = result['profile'] = sim.profiler.summary()
+    if spec.get('path_metrics'):
+        metadata['path_metrics'] = result['path_metrics'] = run_metrics(sim)
+    on_written = None
+    if spec.get('keep_checkpoints'):
+        save(t - 1)
+    elif os.path.exists(checkpoint):
+        # The checkpoint is only removed once the results are on disk
+        def on_written():
+            os.remove(checkpoint)
+    background_writer().submit(spec['filename'], metadata, series.columns(), spec['output_format'], on_written)
+    return result
 
 if __name__ == '__main__':
     """
     Simulation parameters
     """
-    for i in range(5):
-        deposit_rate = i/5
-        run(subfolder_name='deposit'+str(deposit_rate), deposit=deposit_rate, decay=0.2)
+    if adaptive:
+        # Iterations are added per deposit rate until its result is precise enough
+        run_adaptive([i/5 for i in range(5)], decay=0.2)
+    else:
+        # All deposit rates run in one sweep so the worker pool stays busy
+        seed = sweep_root_seed()
+        specs = []
+        for i in range(5):
+            deposit_rate = i/5
+            make_folders("sim_results", 'deposit'+str(deposit_rate))
+            specs.extend(make_specs(subfolder_name='deposit'+str(deposit_rate), deposit=deposit_rate, decay=0.2, root_seed=seed))
+        results = run_catalogued_sweep(specs, processes)
+        if profile:
+            print_profiles(zip(specs, results))
+    print("All simulations finished.")
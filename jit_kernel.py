@@ -0,0 +1,296 @@
+import warnings
+import numpy as np
+import ant_model_walkback as amw
+from ant_model_walkback import Model
+from maze_index import MazeIndex
+from pheromone_store import PheromoneStore
+from rng_streams import BlockRandom
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def step_kernel(timestep, wave_timesteps, wave_ants, n_ants, total_spawned,
+                neighbor_table, cell_types, colony_cell, values, active, n_active, is_active,
+                cell, hasfood, path_length, final_path_length, moves, visited, random_numbers,
+                decay_rate, pheromone_deposit, decay_strength, max_pheromone, base_chance, food, max_moves):
+    """
+    One Model.update over flat arrays: spawn, decay, then every ant steps in order and
+    delivers its food. Follows Ant.step line by line, with the random number choice of
+    an ant that runs on a random stream. path_length counts the moves of an ant, searching
+    ants with max_moves moves turn back.
+    Returns the food delivered, the ants carrying food, the ants spawned, the number of
+    active cells and the number of random numbers used.
+    """
+    if timestep % wave_timesteps == 0 and total_spawned < n_ants:
+        total_spawned += min(wave_ants, n_ants - total_spawned)
+
+    # Decay the active cells and drop the ones that reached zero
+    if decay_rate != 0:
+        factor = 1 - decay_rate
+        kept = 0
+        for i in range(n_active):
+            c = active[i]
+            level = values[c]*factor
+            values[c] = level
+            if level != 0:
+                active[kept] = c
+                kept += 1
+            else:
+                is_active[c] = 0
+        n_active = kept
+
+    delivered = 0
+    carrying = 0
+    used = 0
+    candidates = np.empty(4, dtype=np.int64)
+    for a in range(total_spawned):
+        c = cell[a]
+        value = cell_types[c]
+        if value == food:
+            hasfood[a] = True
+        forward = False
+        if hasfood[a]:
+            if c == colony_cell:
+                hasfood[a] = False
+                visited[a, :] = 0
+                visited[a, c >> 3] |= 1 << (c & 7)
+                path_length[a] = 0
+                carrying += hasfood[a]
+                continue
+            elif value == food:
+                final_path_length[a] = path_length[a] + 1
+            elif value >= 0 and value < 1:
+                amount = pheromone_deposit*((((path_length[a] + 1)/final_path_length[a]) / decay_strength)**2)
+                level = values[c] + amount
+                values[c] = max_pheromone if max_pheromone < level else level
+                if is_active[c] == 0:
+                    is_active[c] = 1
+                    active[n_active] = c
+                    n_active += 1
+        elif path_length[a] < max_moves:
+            # Unvisited neighbors in direction order
+            n_candidates = 0
+            for d in range(4):
+                neighbor = neighbor_table[c, d]
+                if neighbor >= 0 and not (visited[a, neighbor >> 3] >> (neighbor & 7)) & 1:
+                    candidates[n_candidates] = d
+                    n_candidates += 1
+            if n_candidates > 0:
+                total_chance = 0.0
+                for k in range(n_candidates):
+                    total_chance += values[neighbor_table[c, candidates[k]]] + base_chance
+                u = random_numbers[used]
+                used += 1
+                chosen = -1
+                if total_chance == n_candidates*base_chance:
+                    chosen = candidates[int(u*n_candidates)]
+                else:
+                    pheromone_pick = u*total_chance
+                    current_chance = 0.0
+                    for k in range(n_candidates):
+                        current_chance += values[neighbor_table[c, candidates[k]]] + base_chance
+                        if current_chance >= pheromone_pick:
+                            chosen = candidates[k]
+                            break
+                if chosen >= 0:
+                    c = neighbor_table[c, chosen]
+                    cell[a] = c
+                    visited[a, c >> 3] |= 1 << (c & 7)
+                    moves[a, path_length[a]] = chosen
+                    path_length[a] += 1
+                    forward = True
+        # Move back to the colony along the path
+        if not forward and path_length[a] > 0:
+            path_length[a] -= 1
+            c = neighbor_table[c, (moves[a, path_length[a]] + 2) % 4]
+            cell[a] = c
+
+        # Check if the ant returned the food to the colony
+        if hasfood[a] and c == colony_cell:
+            delivered += 1
+            hasfood[a] = False
+            visited[a, :] = 0
+            visited[a, c >> 3] |= 1 << (c & 7)
+            path_length[a] = 0
+        carrying += hasfood[a]
+    return delivered, carrying, total_spawned, n_active, used
+
+
+if numba is not None:
+    step_kernel = numba.njit(cache=True)(step_kernel)
+
+
+class JitModel:
+    def __init__(self, maze, width, height, rng=None):
+        """
+        Model that runs every timestep in one compiled kernel over flat arrays.
+        With the same random stream it gives the same results as Model.
+        Without a stream the run draws a stream seed from the global numpy random state.
+        """
+        self.width = width
+        self.height = height
+        self.nAnts = amw.nAnts
+        self.nWaveAnts = amw.nWaveAnts
+        self.WaveTimesteps = amw.WaveTimesteps
+        self.total_ants_spawned = 0
+        if rng is None:
+            rng = BlockRandom(np.random.default_rng(np.random.randint(2**63, dtype=np.int64)))
+        self.rng = rng
+        # Optional recorder.RunRecorder that stores the state after every update
+        self.recorder = None
+        # Optional profiling.PhaseProfiler, the kernel is timed as a whole
+        self.profiler = None
+
+        # Our grid is a maze with walls (2) and open spaces (0)
+        self.grid = maze
+
+        # We initialize colony in the top left and the food at the bottom right
+        self.colony_position = amw.colony_position
+        self.food_position = amw.food_position
+
+        # Colony is represented as a -1 and food as a 1
+        self.grid[self.colony_position] = amw.colony
+        self.grid[self.food_position] = amw.food
+
+        # Track the food deliverd
+        self.food_found = 0
+
+        # Track if food is discovered
+        self.food_discovered = False
+
+        # Number of ants carrying food after the last update
+        self.ants_with_food = 0
+
+        self.maze_index = MazeIndex.for_grid(self.grid)
+        self.colony_cell = self.maze_index.cell_of(self.colony_position)
+        self.max_moves = amw.wander_limit(self.maze_index, self.colony_position, self.food_position)
+        self.cell_types = np.ascontiguousarray(self.maze_index.cell_types)
+        self.neighbor_table = np.ascontiguousarray(self.maze_index.neighbor_table)
+        # The kernel keeps the active cells of the store in a buffer with room for every cell
+        self.pheromone_store = PheromoneStore(self.maze_index)
+        self.active = np.empty(self.maze_index.n_cells, dtype=self.maze_index.flat.dtype)
+        self.is_active = np.frombuffer(self.pheromone_store.is_active, dtype=np.uint8)
+
+        # Ant state, one row per ant, all ants start at the colony
+        self.cell = np.full(self.nAnts, self.colony_cell, dtype=np.int64)
+        self.hasfood = np.zeros(self.nAnts, dtype=np.bool_)
+        self.path_length = np.zeros(self.nAnts, dtype=np.int64)
+        self.final_path_length = np.zeros(self.nAnts, dtype=np.int64)
+        self.moves = np.zeros((self.nAnts, 64), dtype=np.uint8)
+        self.visited = np.zeros((self.nAnts, (self.maze_index.n_cells + 7) // 8), dtype=np.uint8)
+        self.visited[:, self.colony_cell >> 3] = 1 << (self.colony_cell & 7)
+
+    @property
+    def pheromones(self):
+        """
+        Pheromone levels as a grid of the maze shape.
+        """
+        return self.pheromone_store.dense()
+
+    def count_ants_with_food(self):
+        """
+        Number of ants currently carrying food.
+        """
+        return self.ants_with_food
+
+    def ant_states(self):
+        """
+        Cell ids and food flags of the spawned ants as two arrays.
+        """
+        return self.cell[:self.total_ants_spawned], self.hasfood[:self.total_ants_spawned]
+
+    def ant_positions(self):
+        """
+        Positions (x, y) of the ants without food and of the ants with food, as two (n, 2) arrays.
+        """
+        cells, hasfood = self.ant_states()
+        coords = self.maze_index.coords[cells]
+        return coords[~hasfood], coords[hasfood]
+
+    def ant_path_lengths(self):
+        """
+        Moves on the path of every spawned ant and the length of its last path to the food.
+        """
+        return self.path_length[:self.total_ants_spawned].copy(), self.final_path_length[:self.total_ants_spawned].copy()
+
+    def get_state(self):
+        """
+        State of the run in the format of Model.get_state.
+        """
+        n = self.total_ants_spawned
+        move_counts = self.path_length[:n].copy()
+        has_move = np.arange(self.moves.shape[1]) < move_counts[:, None]
+        state = self.pheromone_store.get_state()
+        state.update(total_ants_spawned=n, food_found=self.food_found, food_discovered=self.food_discovered,
+                     ants_with_food=self.ants_with_food, ant_cell=self.cell[:n].copy(), ant_hasfood=self.hasfood[:n].copy(),
+                     ant_final_path_length=self.final_path_length[:n].copy(), ant_move_counts=move_counts,
+                     ant_moves=self.moves[:n][has_move], ant_visited=self.visited[:n].copy())
+        return state
+
+    def set_state(self, state):
+        """
+        Continue from a state returned by get_state.
+        """
+        self.pheromone_store.set_state(state)
+        n_active = len(self.pheromone_store.active_cells)
+        self.active[:n_active] = self.pheromone_store.active_cells
+        self.pheromone_store.active_cells = self.active[:n_active]
+        n = self.total_ants_spawned = int(state['total_ants_spawned'])
+        self.food_found = int(state['food_found'])
+        self.food_discovered = bool(state['food_discovered'])
+        self.ants_with_food = int(state['ants_with_food'])
+        move_counts = np.asarray(state['ant_move_counts'], dtype=np.int64)
+        while n and move_counts.max() + 1 > self.moves.shape[1]:
+            self.moves = np.concatenate((self.moves, np.zeros_like(self.moves)), axis=1)
+        self.cell[:n] = state['ant_cell']
+        self.hasfood[:n] = state['ant_hasfood']
+        self.final_path_length[:n] = state['ant_final_path_length']
+        self.path_length[:n] = move_counts
+        self.moves[:n][np.arange(self.moves.shape[1]) < move_counts[:, None]] = state['ant_moves']
+        self.visited[:n] = state['ant_visited']
+
+    def update(self, timestep):
+        """
+        Update the positions of all ants and pheromones in the grid.
+        """
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        # An ant adds at most one move per timestep
+        if self.path_length.max() + 1 > self.moves.shape[1]:
+            self.moves = np.concatenate((self.moves, np.zeros_like(self.moves)), axis=1)
+        # An ant uses at most one random number per timestep
+        random_numbers = self.rng.peek(self.nAnts)
+        delivered, carrying, self.total_ants_spawned, n_active, used = step_kernel(
+            timestep, self.WaveTimesteps, self.nWaveAnts, self.nAnts, self.total_ants_spawned,
+            self.neighbor_table, self.cell_types, self.colony_cell, self.pheromone_store.values,
+            self.active, len(self.pheromone_store.active_cells), self.is_active,
+            self.cell, self.hasfood, self.path_length, self.final_path_length, self.moves, self.visited,
+            random_numbers, amw.decay_rate, amw.pheromone_deposit, amw.decay_strength, amw.max_pheromone,
+            amw.base_chance, amw.food, self.max_moves)
+        self.rng.advance(used)
+        self.pheromone_store.active_cells = self.active[:n_active]
+        self.ants_with_food = carrying
+        if delivered:
+            self.food_discovered = True
+            self.food_found += delivered
+        if profiler is not None:
+            profiler.lap('kernel')
+            profiler.count('timesteps')
+            profiler.count('ant_steps', self.total_ants_spawned)
+            profiler.count('deliveries', delivered)
+        if self.recorder is not None:
+            self.recorder.record(timestep, self)
+
+
+def jit_model(maze, width, height, rng=None):
+    """
+    JitModel when numba is installed, otherwise the Python Model.
+    """
+    if numba is None:
+        warnings.warn("numba is not installed, the 'jit' engine falls back to the python engine")
+        return Model(maze, width, height, rng=rng)
+    return JitModel(maze, width, height, rng=rng)
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import numpy as np
+from maze_generator_with_nPaths import generate_maze_with_paths, upscale_maze
+
+# Folder of the cache, relative to the working directory, None turns the cache off
+cache_folder = 'maze_cache'
+
+# Most disk space the cache may use, the least recently used files are removed beyond it
+max_cache_bytes = 2**30
+
+# Change when the maze generator makes different mazes for the same seed, so old entries are not used
+generator_version = 1
+
+
+def maze_key(dimension, nPaths, seed, scale):
+    """
+    Key of a generated maze.
+    """
+    text = f'maze {generator_version} {dimension} {nPaths} {seed} {scale}'
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class MazeCache:
+    def __init__(self, folder=cache_folder, max_bytes=max_cache_bytes):
+        """
+        Mazes and arrays derived from them stored as .npy files, shared by all processes that
+        use the same folder. Files are memory mapped, so processes read them without copying.
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def path(self, key, name):
+        return os.path.join(self.folder, f'{key}.{name}.npy')
+
+    def load(self, path, mmap_mode='r'):
+        """
+        Memory map a cached array, None if it is not in the cache.
+        """
+        try:
+            array = np.load(path, mmap_mode=mmap_mode)
+        except (FileNotFoundError, ValueError):
+            return None
+        # The modification time tells eviction when the file was last used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return array
+
+    def store(self, path, array):
+        """
+        Write an array under a temporary name and move it in place, so other processes never see half a file.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as file:
+            np.save(file, np.asarray(array))
+        try:
+            os.replace(temporary_path, path)
+        except PermissionError:
+            # On Windows a file mapped by another process can not be replaced, that process already stored it
+            os.remove(temporary_path)
+
+    def maze(self, dimension, nPaths, seed, scale):
+        """
+        The upscaled maze for these parameters, generated only if no process made it before.
+        The maze is mapped copy-on-write: changing it (placing the colony and food) copies only
+        the changed pages and does not change the cached file.
+        """
+        path = self.path(maze_key(dimension, nPaths, seed, scale), 'maze')
+        maze = self.load(path, mmap_mode='c')
+        if maze is None:
+            maze = upscale_maze(generate_maze_with_paths(dimension, dimension, nPaths, randomseed=seed), scale)
+            self.store(path, maze)
+            self.evict(keep=(path,))
+            maze = self.load(path, mmap_mode='c')
+        return maze
+
+    def derived(self, key, name, array_names, build):
+        """
+        Arrays derived from a maze, such as its neighbor tables, as a dictionary of read only
+        memory maps. build() computes them as a dictionary when they are not all in the cache.
+        """
+        paths = {array_name: self.path(key, f'{name}.{array_name}') for array_name in array_names}
+        arrays = {array_name: self.load(path) for array_name, path in paths.items()}
+        if any(array is None for array in arrays.values()):
+            arrays = build()
+            for array_name, path in paths.items():
+                self.store(path, arrays[array_name])
+            self.evict(keep=tuple(paths.values()))
+            arrays = {array_name: self.load(path) for array_name, path in paths.items()}
+        return arrays
+
+    def evict(self, keep=()):
+        """
+        Remove the least recently used files until the cache fits in max_bytes.
+        """
+        files = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.endswith('.npy') and entry.path not in keep:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files) + sum(os.path.getsize(path) for path in keep if os.path.exists(path))
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            # Processes that mapped the file keep their mapping after it is removed
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except PermissionError:
+                # Mapped files can not be removed on Windows, they are removed by a later eviction
+                continue
+            total -= size
+
+
+# Cache of this process
+_cache = None
+
+
+def default_cache():
+    """
+    Cache in cache_folder with max_cache_bytes, None when cache_folder is None.
+    """
+    global _cache
+    if cache_folder is None:
+        return None
+    if _cache is None or (_cache.folder, _cache.max_bytes) != (cache_folder, max_cache_bytes):
+        _cache = MazeCache(cache_folder, max_cache_bytes)
+    return _cache
@@ -1,57 +1,75 @@
 import random
 import numpy as np
 
+# Directions in which passages are carved
+directions = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
 # Initialize the maze with all walls
 def initialize_maze(rows, cols):
-    maze = np.array([[2] * cols for _ in range(rows)])
+    maze = np.full((rows, cols), 2, dtype=np.int8)
     return maze
 
-# Recursive function to carve passages in the maze
-def carve_passages_from(cx, cy, maze, rows, cols, path_count, current_paths):
-    """Function that generates paths until path count is reached"""
-    directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-    random.shuffle(directions)
-    # Try each direction
-    for direction in directions:
-        nx, ny = cx + direction[0] * 2, cy + direction[1] * 2
-        # Check if the new cell is within bounds and not visited
-        if 0 <= nx < rows and 0 <= ny < cols and maze[nx][ny] == 2:
-            maze[cx + direction[0]][cy + direction[1]] = 0
-            maze[nx][ny] = 0
-            # Recursively carve passages from the new cell
-            carve_passages_from(nx, ny, maze, rows, cols, path_count, current_paths)
+# Depth first carving of passages in the maze, with an explicit stack so large mazes do not hit the recursion limit
+def carve_passages_from(cx, cy, maze, rows, cols, path_count, current_paths, rng=random):
+    """Function that generates paths until path count is reached
+    Makes the same random calls in the same order as carving recursively, so a seed gives the same maze"""
+    # Work on a flat bytearray, indexing it is much faster than indexing the numpy array
+    cells = bytearray(maze.astype(np.int8).tobytes())
+
+    def shuffled_directions():
+        order = list(directions)
+        rng.shuffle(order)
+        return order
+
+    order = shuffled_directions()
+    # Every frame holds a cell, its shuffled directions and the directions still to try
+    stack = [(cx, cy, order, iter(order))]
+    while stack:
+        cx, cy, order, remaining = stack[-1]
+        # Try each remaining direction
+        for dx, dy in remaining:
+            nx, ny = cx + dx * 2, cy + dy * 2
+            # Check if the new cell is within bounds and not visited
+            if 0 <= nx < rows and 0 <= ny < cols and cells[nx * cols + ny] == 2:
+                cells[(cx + dx) * cols + cy + dy] = 0
+                cells[nx * cols + ny] = 0
+                # Continue carving from the new cell, this frame resumes when it is done
+                new_order = shuffled_directions()
+                stack.append((nx, ny, new_order, iter(new_order)))
+                break
+        else:
+            stack.pop()
+            # Add extra paths once all directions of the cell are carved
+            if current_paths[0] < path_count:
+                for dx, dy in order:
+                    nx, ny = cx + dx * 2, cy + dy * 2
+                    if 0 <= nx < rows and 0 <= ny < cols and cells[nx * cols + ny] == 0:
+                        # Randomly add a connection to create more paths
+                        # (probability can be changed / seed can be set)
+                        if rng.random() < 0.5:
+                            cells[(cx + dx) * cols + cy + dy] = 0
+                            current_paths[0] += 1
+                            if current_paths[0] >= path_count:
+                                break
 
-    # Add extra paths after the main recursive call
-    if current_paths[0] < path_count:
-        for direction in directions:
-            nx, ny = cx + direction[0] * 2, cy + direction[1] * 2
-            if 0 <= nx < rows and 0 <= ny < cols and maze[nx][ny] == 0:
-                # Randomly add a connection to create more paths 
-                # (probability can be changed / seed can be set)
-                if random.random() < 0.5:
-                    maze[cx + direction[0]][cy + direction[1]] = 0
-                    current_paths[0] += 1
-                    if current_paths[0] >= path_count:
-                        return
+    maze[...] = np.frombuffer(bytes(cells), dtype=np.int8).reshape(rows, cols)
 
 def generate_maze_with_paths(rows, cols, path_count, randomseed=1275832698236592):
     """Function that generates maze"""
     maze = initialize_maze(rows, cols)
     start_x, start_y = 1, 1
     maze[start_x][start_y] = 0
-    random.seed(randomseed)
+    # Own random generator, seeded like the global one was, so generating a maze does not reseed other code
+    rng = random.Random(randomseed)
     # Track the number of paths created
     current_paths = [1]
-    carve_passages_from(start_x, start_y, maze, rows, cols, path_count, current_paths)
+    carve_passages_from(start_x, start_y, maze, rows, cols, path_count, current_paths, rng)
     return maze
 
 def upscale_maze(maze, scale):
-    rows, cols = maze.shape
-    upscaled_maze = np.zeros((rows * scale, cols * scale))
-    for i in range(rows):
-        for j in range(cols):
-            upscaled_maze[i * scale:(i + 1) * scale, j * scale:(j + 1) * scale] = maze[i][j]
-    return upscaled_maze
+    """Replace every cell by a scale x scale block of the same value"""
+    maze = np.asarray(maze, dtype=np.int8)
+    return np.repeat(np.repeat(maze, scale, axis=0), scale, axis=1)
 
 def print_maze(maze):
     for row in maze:
@@ -0,0 +1,165 @@
+import functools
+import hashlib
+import numpy as np
+
+# Cell type of walls, the other cell types are open
+wall = 2
+
+# Directions in the same order as Ant.get_adjacent_cells: (x, y+1), (x+1, y), (x, y-1), (x-1, y)
+directions = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
+# Indexes of mazes that were built before, keyed by the grid contents
+_index_cache = {}
+
+# Maximum number of indexes kept in the cache
+max_cached_indexes = 16
+
+# Disk cache (a maze_cache.MazeCache) that shares the index arrays between processes, None builds them in every process
+persistent_cache = None
+
+
+def opposite(direction):
+    """
+    Direction that undoes a move in the given direction.
+    """
+    return (direction + 2) % 4
+
+
+def index_dtype(size):
+    """
+    Integer type of cell ids and flat grid indexes for a grid of size cells, int32 when it fits.
+    """
+    return np.int32 if size < 2**31 else np.int64
+
+
+def grid_key(grid):
+    """
+    Key of the contents of a grid.
+    """
+    grid = np.asarray(grid)
+    return f'{grid.shape[0]}x{grid.shape[1]}-{grid.dtype.name}-{hashlib.sha1(np.ascontiguousarray(grid).tobytes()).hexdigest()}'
+
+
+class MazeIndex:
+    def __init__(self, grid, flat=None, neighbor_table=None):
+        """
+        Number the open cells of the grid densely and build their neighbor tables.
+        The index is read only, so it can be shared by all ants and by replicate runs on the same maze.
+        flat and neighbor_table can be given when they were built before (see build_arrays).
+        Ids are int32 below 2**31 grid cells, and the arrays and lists that only some engines
+        use are built when they are first used, so a huge maze only pays for what the engine needs.
+        """
+        grid = np.asarray(grid)
+        self.shape = grid.shape
+        self.width = grid.shape[1]
+        if flat is None or neighbor_table is None:
+            arrays = self.build_arrays(grid)
+            flat, neighbor_table = arrays['flat'], arrays['neighbor_table']
+
+        # Cell ids in row-major order, flat holds the flat grid index of every cell id
+        self.flat = flat
+        self.n_cells = len(self.flat)
+        self.cell_types = grid.reshape(-1)[self.flat]
+
+        # Neighbor of every cell in every direction, -1 where there is a wall or the edge of the grid
+        self.neighbor_table = neighbor_table
+        # Key of the grid contents when the index comes from for_grid, to cache data derived from the maze
+        self.key = None
+
+    @functools.cached_property
+    def coords(self):
+        """
+        (x, y) of every cell id as an (n_cells, 2) array.
+        """
+        return np.column_stack(np.unravel_index(self.flat, self.shape)).astype(self.flat.dtype)
+
+    @functools.cached_property
+    def csr(self):
+        """
+        CSR layout of the open neighbors as (indptr, indices, directions),
+        the neighbors of cell i are indices[indptr[i]:indptr[i+1]].
+        """
+        is_open = self.neighbor_table >= 0
+        indptr = np.r_[0, np.cumsum(np.count_nonzero(is_open, axis=1))]
+        return indptr, self.neighbor_table[is_open], np.nonzero(is_open)[1]
+
+    # Plain Python versions for the per-ant engine, where list lookups beat array indexing
+
+    @functools.cached_property
+    def positions(self):
+        return [tuple(position) for position in self.coords.tolist()]
+
+    @functools.cached_property
+    def neighbor_lists(self):
+        return self.neighbor_table.tolist()
+
+    @functools.cached_property
+    def adjacency(self):
+        return [[(direction, cell) for direction, cell in enumerate(neighbors) if cell >= 0]
+                for neighbors in self.neighbor_lists]
+
+    @functools.cached_property
+    def cell_type_list(self):
+        return self.cell_types.tolist()
+
+    @staticmethod
+    def build_arrays(grid):
+        """
+        The arrays of the index that take work to build: the flat grid index of every open
+        cell and the neighbor table.
+        """
+        shape = grid.shape
+        dtype = index_dtype(grid.size)
+        flat = np.flatnonzero(np.asarray(grid).reshape(-1) != wall).astype(dtype)
+        x0, y0 = np.unravel_index(flat, shape)
+        cell_id = np.full(grid.size, -1, dtype=dtype)
+        cell_id[flat] = np.arange(len(flat))
+        neighbor_table = np.full((len(flat), len(directions)), -1, dtype=dtype)
+        for direction, (dx, dy) in enumerate(directions):
+            x = x0 + dx
+            y = y0 + dy
+            inside = (x >= 0) & (x < shape[0]) & (y >= 0) & (y < shape[1])
+            neighbor_table[inside, direction] = cell_id[x[inside]*shape[1] + y[inside]]
+        return {'flat': flat, 'neighbor_table': neighbor_table}
+
+    @classmethod
+    def for_grid(cls, grid):
+        """
+        Return the index of the grid, reusing the index of an identical grid built before,
+        in this process or (with a persistent cache) in another one.
+        """
+        grid = np.asarray(grid)
+        key = grid_key(grid)
+        if key not in _index_cache:
+            if len(_index_cache) >= max_cached_indexes:
+                _index_cache.pop(next(iter(_index_cache)))
+            if persistent_cache is None:
+                _index_cache[key] = cls(grid)
+            else:
+                name = f'index-{np.dtype(index_dtype(grid.size)).name}'
+                arrays = persistent_cache.derived(key, name, ('flat', 'neighbor_table'), lambda: cls.build_arrays(grid))
+                _index_cache[key] = cls(grid, **arrays)
+            _index_cache[key].key = key
+        return _index_cache[key]
+
+    def cell_of(self, position):
+        """
+        Cell id of an (x, y) position, -1 for walls. flat is sorted, so the id is found by
+        bisection without an array over the whole grid.
+        """
+        index = position[0]*self.width + position[1]
+        cell = int(np.searchsorted(self.flat, index))
+        return cell if cell < self.n_cells and self.flat[cell] == index else -1
+
+    def position_of(self, cell):
+        """
+        (x, y) position of a cell id.
+        """
+        return self.positions[cell]
+
+    def neighbors(self, cell):
+        """
+        Open neighbors of a cell id.
+        """
+        indptr, indices, _ = self.csr
+        return indices[indptr[cell]:indptr[cell + 1]]
@@ -0,0 +1,166 @@
+import mmap
+import numpy as np
+
+# Types the pheromone levels can be stored as. float64 gives the reference results, float32 halves
+# the memory of the levels, the levels then differ slightly and the engines round differently
+pheromone_dtypes = ('float64', 'float32')
+
+# Type of the levels of new stores
+pheromone_dtype = 'float64'
+
+# Store the levels and active flags in tiles of memory that only take up memory once pheromone is
+# deposited in them, for huge mazes where the ants only reach a part of the maze
+use_tiles = False
+
+# Tiles need private anonymous memory maps that can give their pages back, which only Unix has.
+# Elsewhere tiled stores fall back to plain arrays
+tiles_supported = hasattr(mmap, 'MAP_PRIVATE') and hasattr(mmap, 'MADV_DONTNEED')
+
+
+def allocate_tiled(count, dtype):
+    """
+    Zeroed array of count values in an anonymous memory map, and the map. The operating system
+    only backs a tile (a page of the map) with memory when a value in it is written.
+    """
+    itemsize = np.dtype(dtype).itemsize
+    buffer = mmap.mmap(-1, max(count*itemsize, 1), flags=mmap.MAP_PRIVATE)
+    return np.frombuffer(buffer, dtype=dtype, count=count), buffer
+
+
+class PheromoneStore:
+    def __init__(self, maze_index, replicates=1, dtype=None, tiled=None):
+        """
+        Pheromone levels of the open cells of a maze, indexed by cell id.
+        Decay is only applied to the active cells, the cells that carry pheromone,
+        so the cost of a timestep does not depend on the size of the grid.
+        Replicates of the same maze are stacked, cell c of replicate r has index r*n_cells + c.
+        dtype and tiled default to the module settings pheromone_dtype and use_tiles, tiled is
+        ignored where tiles are not supported (see tiles_supported) and the levels are a plain array.
+        """
+        dtype = pheromone_dtype if dtype is None else dtype
+        tiled = (use_tiles if tiled is None else tiled) and tiles_supported
+        if dtype not in pheromone_dtypes:
+            raise ValueError(f"Unknown pheromone type '{dtype}', choose from {list(pheromone_dtypes)}")
+        self.maze_index = maze_index
+        self.replicates = replicates
+        self.tiled = tiled
+        # Levels and flags of the active cells
+        if tiled:
+            self.values, values_map = allocate_tiled(replicates*maze_index.n_cells, dtype)
+            self.is_active = mmap.mmap(-1, max(len(self.values), 1), flags=mmap.MAP_PRIVATE)
+            self.maps = (values_map, self.is_active)
+        else:
+            self.values = np.zeros(replicates*maze_index.n_cells, dtype=dtype)
+            self.is_active = bytearray(len(self.values))
+            self.maps = ()
+        # Active cells and the cells activated since the last decay
+        self.active_cells = np.empty(0, dtype=np.int64)
+        self.new_cells = []
+        self.grid = None
+
+    def add(self, cell, amount, max_pheromone):
+        """
+        Deposit pheromone on one cell, capped at max_pheromone.
+        """
+        values = self.values
+        values[cell] = min(values[cell] + amount, max_pheromone)
+        if not self.is_active[cell]:
+            self.is_active[cell] = 1
+            self.new_cells.append(cell)
+
+    def set(self, cells, levels):
+        """
+        Set the pheromone level of distinct cells, for engines that compute the levels themselves.
+        """
+        self.values[cells] = levels
+        for cell in cells[levels > 0].tolist():
+            if not self.is_active[cell]:
+                self.is_active[cell] = 1
+                self.new_cells.append(cell)
+
+    def decay(self, decay_rate):
+        """
+        Multiply the pheromone of every active cell by (1-decay_rate).
+        Gives exactly the same levels as multiplying the full grid, since inactive cells are zero.
+        """
+        if self.new_cells:
+            self.active_cells = np.concatenate((self.active_cells, self.new_cells))
+            self.new_cells = []
+        if decay_rate == 0 or len(self.active_cells) == 0:
+            return
+        decayed = self.values[self.active_cells] * (1-decay_rate)
+        self.values[self.active_cells] = decayed
+        # Cells whose pheromone underflowed to zero leave the active set
+        if not decayed.all():
+            empty = self.active_cells[decayed == 0]
+            for cell in empty.tolist():
+                self.is_active[cell] = 0
+            self.active_cells = self.active_cells[decayed != 0]
+
+    def freeze(self, replicate):
+        """
+        Stop decaying a replicate, its levels are kept as they are.
+        """
+        n_cells = self.maze_index.n_cells
+        self.decay(0)
+        frozen = self.active_cells // n_cells == replicate
+        self.active_cells = self.active_cells[~frozen]
+        # Frozen cells stay flagged as active so deposits can not add them back
+        self.is_active[replicate*n_cells:(replicate + 1)*n_cells] = b'\x01'*n_cells
+
+    def get_state(self):
+        """
+        Levels and active cells, enough to continue the decay exactly where it was.
+        """
+        active_cells = np.concatenate((self.active_cells, np.asarray(self.new_cells, dtype=np.int64)))
+        return {'pheromone_values': self.values.copy(), 'active_cells': active_cells}
+
+    def set_state(self, state):
+        """
+        Restore the levels and active cells of get_state. Only cells that hold pheromone are
+        written, so a tiled store only takes memory for the tiles in use.
+        """
+        self.clear()
+        values = np.asarray(state['pheromone_values'])
+        levels = np.flatnonzero(values)
+        self.values[levels] = values[levels]
+        self.active_cells = np.asarray(state['active_cells'], dtype=np.int64)
+        self.new_cells = []
+        for cell in self.active_cells.tolist():
+            self.is_active[cell] = 1
+
+    def clear(self):
+        """
+        Zero every level and flag.
+        """
+        if self.tiled:
+            # Giving the pages of the maps back zeroes them without touching every tile
+            for tiles in self.maps:
+                tiles.madvise(mmap.MADV_DONTNEED)
+        else:
+            self.values[:] = 0
+            self.is_active[:] = bytes(len(self.is_active))
+
+    def tile_cells(self):
+        """
+        Number of cells in a tile of a tiled store.
+        """
+        return mmap.PAGESIZE // self.values.itemsize
+
+    def tiles_in_use(self):
+        """
+        Number of tiles that hold pheromone now, tiles that held pheromone before keep their memory.
+        """
+        return len(np.unique(self.active_cells // self.tile_cells()))
+
+    def dense(self, replicate=0):
+        """
+        Materialize the pheromone levels of a replicate as a grid of the maze shape, walls are zero.
+        The returned grid is reused between calls, so it stays valid for plotting. It is a full
+        grid even for a tiled store, runs only build it to plot or compare the levels.
+        """
+        if self.grid is None:
+            self.grid = np.zeros(self.maze_index.shape, dtype=self.values.dtype)
+        n_cells = self.maze_index.n_cells
+        self.grid.reshape(-1)[self.maze_index.flat] = self.values[replicate*n_cells:(replicate + 1)*n_cells]
+        return self.grid
@@ -0,0 +1,80 @@
+import time
+
+# Phases of a model update: spawning ants, decaying the pheromones, moving the searching ants
+# (forward or back out of dead ends), walking the food carrying ants back while they deposit
+# pheromones, and counting the food delivered at the colony
+phases = ('spawn', 'decay', 'movement', 'deposit', 'delivery')
+
+
+class PhaseProfiler:
+    def __init__(self):
+        """
+        Time spent per phase of the model updates and counts of what the ants did.
+        Attach it with model.profiler = profiler, a model without a profiler is not timed at all.
+        The python engine times every ant step, which slows the run down, so compare the
+        shares of the phases rather than the absolute times with unprofiled runs.
+        """
+        self.times = {}
+        self.counts = {}
+        self.last = 0.0
+
+    def start(self):
+        """
+        Start timing an update.
+        """
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        Add the time since the last lap (or start) to phase.
+        """
+        now = time.perf_counter()
+        self.times[phase] = self.times.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def summary(self):
+        """
+        The totals as a dictionary: seconds per phase, total seconds, the counts and ant-steps per second.
+        """
+        seconds = sum(self.times.values())
+        ordered = [phase for phase in phases if phase in self.times] + [phase for phase in self.times if phase not in phases]
+        summary = {'phases': {phase: self.times[phase] for phase in ordered}, 'seconds': seconds}
+        summary.update(self.counts)
+        if 'ant_steps' in self.counts and seconds > 0:
+            summary['ant_steps_per_second'] = self.counts['ant_steps']/seconds
+        return summary
+
+
+def format_summary(summary):
+    """
+    One line with the throughput, the counts and the share of every phase.
+    """
+    parts = []
+    if 'ant_steps_per_second' in summary:
+        parts.append(f"{summary['ant_steps_per_second']:,.0f} ant-steps/s")
+    parts.extend(f"{summary[name]} {name.replace('_', ' ')}" for name in ('timesteps', 'ant_steps', 'backtracks', 'deliveries')
+                 if name in summary)
+    if summary['seconds'] > 0:
+        parts.append(', '.join(f"{phase} {100*seconds/summary['seconds']:.0f}%" for phase, seconds in summary['phases'].items()))
+    return '; '.join(parts)
+
+
+def print_profiles(runs):
+    """
+    Print the profile of every run with its number of ants, maze size and number of paths, to see
+    how the cost scales with them. runs are (spec, result) pairs, results without a profile are left out.
+    """
+    runs = [(spec, result) for spec, result in runs if result and 'profile' in result]
+    print(f"{'nAnts':>6} {'maze':>6} {'nPaths':>6} {'seconds':>8} {'us/ant-step':>11}  phases")
+    for spec, result in sorted(runs, key=lambda run: (run[0]['parameters']['nAnts'], run[0]['parameters']['maze_dimention'],
+                                                      run[0]['parameters']['nPaths'])):
+        summary = result['profile']
+        parameters = spec['parameters']
+        maze_size = parameters['maze_dimention']*parameters['maze_scale']
+        per_step = 1e6*summary['seconds']/summary['ant_steps'] if summary.get('ant_steps') else float('nan')
+        shares = ', '.join(f"{phase} {100*seconds/summary['seconds']:.0f}%" for phase, seconds in summary['phases'].items()
+                           if summary['seconds'] > 0)
+        print(f"{parameters['nAnts']:>6} {maze_size:>6} {parameters['nPaths']:>6} {summary['seconds']:>8.2f} {per_step:>11.2f}  {shares}")
@@ -0,0 +1,159 @@
+import json
+import os
+import numpy as np
+from maze_index import MazeIndex
+
+# Storage types of the pheromone snapshots, 'uint8' quantizes levels to 255 steps of max_pheromone
+pheromone_dtypes = ('float32', 'float16', 'uint8')
+
+
+class RunRecorder:
+    def __init__(self, folder, model, nStop, every=1, pheromone_dtype='float16', max_pheromone=1.0, frames=0):
+        """
+        Stream the state of a model into memory mapped .npy files in folder every every-th
+        timestep: the pheromone level of every open cell and the cell and food flag of every ant.
+        The files are allocated for nStop timesteps up front, a recording step only copies
+        the arrays of the model. Attach it with model.recorder = recorder.
+        With frames > 0 the recording continues in the existing files after its first frames
+        frames, for a run resumed from a checkpoint. Files of a smaller nStop are grown to the new one.
+        """
+        if pheromone_dtype not in pheromone_dtypes:
+            raise ValueError(f"Unknown pheromone type '{pheromone_dtype}', choose from {list(pheromone_dtypes)}")
+        self.folder = folder
+        self.every = every
+        self.pheromone_dtype = pheromone_dtype
+        self.max_pheromone = max_pheromone
+        self.n_cells = model.maze_index.n_cells
+        self.frames = frames
+        os.makedirs(folder, exist_ok=True)
+        np.save(os.path.join(folder, 'grid.npy'), np.asarray(model.grid))
+
+        capacity = max(1, -(-nStop // every))
+        n_ants = model.nAnts
+
+        def allocate(name, shape, dtype):
+            path = os.path.join(folder, f'{name}.npy')
+            if not frames:
+                return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+            existing = np.load(path, mmap_mode='r')
+            if len(existing) >= shape[0]:
+                del existing
+                return np.load(path, mmap_mode='r+')
+            # A run resumed with a larger nStop, the recorded frames are copied into a larger file
+            temporary_path = path + '.tmp.npy'
+            grown = np.lib.format.open_memmap(temporary_path, mode='w+', dtype=existing.dtype,
+                                              shape=(shape[0],) + existing.shape[1:])
+            grown[:frames] = existing[:frames]
+            grown.flush()
+            del grown, existing
+            os.replace(temporary_path, path)
+            return np.load(path, mmap_mode='r+')
+
+        self.timesteps = allocate('timesteps', (capacity,), np.int32)
+        self.food_found = allocate('food_found', (capacity,), np.int32)
+        self.pheromones = allocate('pheromones', (capacity, self.n_cells), pheromone_dtype)
+        # Cells of the ants, -1 for ants that are not spawned yet
+        self.ant_cells = allocate('ant_cells', (capacity, n_ants), np.int32)
+        self.ant_food = allocate('ant_food', (capacity, n_ants), np.bool_)
+        self.write_metadata()
+
+    def write_metadata(self):
+        metadata = {'frames': self.frames, 'every': self.every, 'pheromone_dtype': self.pheromone_dtype,
+                    'max_pheromone': self.max_pheromone}
+        with open(os.path.join(self.folder, 'recording.json'), 'w') as file:
+            json.dump(metadata, file)
+
+    def record(self, timestep, model):
+        """
+        Store the state of the model after the update of timestep, if it is a recorded timestep.
+        """
+        if timestep % self.every != 0:
+            return
+        if self.frames == len(self.timesteps):
+            raise ValueError(f"The recording in {self.folder} is full after {self.frames} frames, record for a larger nStop")
+        i = self.frames
+        self.timesteps[i] = timestep
+        self.food_found[i] = np.atleast_1d(model.food_found)[0]
+        values = model.pheromone_store.values[:self.n_cells]
+        if self.pheromone_dtype == 'uint8':
+            self.pheromones[i] = np.rint(np.minimum(values/self.max_pheromone, 1)*255)
+        else:
+            self.pheromones[i] = values
+        cells, hasfood = model.ant_states()
+        self.ant_cells[i, :len(cells)] = cells
+        self.ant_cells[i, len(cells):] = -1
+        self.ant_food[i, :len(hasfood)] = hasfood
+        self.ant_food[i, len(hasfood):] = False
+        self.frames += 1
+
+    def close(self):
+        """
+        Flush the files and store how many frames were recorded.
+        """
+        for array in (self.timesteps, self.food_found, self.pheromones, self.ant_cells, self.ant_food):
+            array.flush()
+        self.write_metadata()
+
+
+class Recording:
+    def __init__(self, folder):
+        """
+        Read a recording made by RunRecorder. The arrays are memory mapped, so a frame is
+        only read from disk when it is used.
+        """
+        self.folder = folder
+        with open(os.path.join(folder, 'recording.json')) as file:
+            self.metadata = json.load(file)
+        self.frames = self.metadata['frames']
+        self.grid = np.load(os.path.join(folder, 'grid.npy'))
+        self.maze_index = MazeIndex.for_grid(self.grid)
+
+        def load(name):
+            return np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r')[:self.frames]
+
+        self.timesteps = load('timesteps')
+        self.food_found = load('food_found')
+        self.pheromone_levels = load('pheromones')
+        self.ant_cells = load('ant_cells')
+        self.ant_food = load('ant_food')
+
+    def frame_at(self, timestep):
+        """
+        Index of the last frame recorded at or before timestep.
+        """
+        return max(int(np.searchsorted(self.timesteps, timestep, side='right')) - 1, 0)
+
+    def cell_pheromones(self, frame):
+        """
+        Pheromone level of every open cell in a frame.
+        """
+        levels = np.asarray(self.pheromone_levels[frame], dtype=float)
+        if self.metadata['pheromone_dtype'] == 'uint8':
+            levels *= self.metadata['max_pheromone']/255
+        return levels
+
+    def pheromones(self, frame):
+        """
+        Pheromone levels of a frame as a grid of the maze shape.
+        """
+        grid = np.zeros(self.maze_index.shape)
+        grid.reshape(-1)[self.maze_index.flat] = self.cell_pheromones(frame)
+        return grid
+
+    def ant_positions(self, frame):
+        """
+        Positions (x, y) of the ants without food and of the ants with food in a frame.
+        """
+        spawned = self.ant_cells[frame] >= 0
+        coords = self.maze_index.coords[self.ant_cells[frame][spawned]]
+        hasfood = self.ant_food[frame][spawned]
+        return coords[~hasfood], coords[hasfood]
+
+    def total_pheromone(self):
+        """
+        Total pheromone over the open cells for every frame.
+        """
+        totals = np.asarray(self.pheromone_levels, dtype=float).sum(axis=1)
+        if self.metadata['pheromone_dtype'] == 'uint8':
+            totals *= self.metadata['max_pheromone']/255
+        return totals
@@ -0,0 +1,37 @@
+import argparse
+import ant_model_walkback as amw
+from recorder import Recording
+
+
+def replay(folder, start=0, stop=None, render_every=1, target_fps=30, export_path=None):
+    """
+    Show the recorded frames of a run between timesteps start and stop with the Visualization,
+    or write them to export_path (a video or a folder of images).
+    """
+    recording = Recording(folder)
+    first = recording.frame_at(start)
+    last = recording.frames if stop is None else recording.frame_at(stop) + 1
+    shape = recording.grid.shape
+    vis = amw.Visualization(recording.grid, recording.pheromones(first), shape[0], shape[1],
+                            render_every=render_every, target_fps=target_fps, export_path=export_path)
+    # Color scale of the pheromones as recorded
+    vis.ph_im.set_clim(0, recording.metadata['max_pheromone'])
+    for frame in range(first, last):
+        t = int(recording.timesteps[frame])
+        if not vis.should_render(t):
+            continue
+        ant_without_food_positions, ant_with_food_positions = recording.ant_positions(frame)
+        vis.update(t, ant_without_food_positions, ant_with_food_positions, recording.pheromones(frame), force=True)
+    vis.persist()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded run')
+    parser.add_argument('folder', help='folder written by recorder.RunRecorder')
+    parser.add_argument('--start', type=int, default=0, help='first timestep to show')
+    parser.add_argument('--stop', type=int, default=None, help='last timestep to show')
+    parser.add_argument('--every', type=int, default=1, help='show every k-th timestep')
+    parser.add_argument('--fps', type=float, default=30, help='frames per second')
+    parser.add_argument('--export', default=None, help='write the frames to a .mp4, .gif or folder of .png images')
+    args = parser.parse_args()
+    replay(args.folder, args.start, args.stop, args.every, args.fps, args.export)
@@ -0,0 +1,173 @@
+import itertools
+import numpy as np
+
+# Seed of the resamples, the intervals and p-values are the same every time for the same data
+resample_seed = 16436
+
+# Number of bootstrap resamples and permutations
+n_resamples = 10000
+
+# Largest number of values drawn at once, the resamples are done in batches of at most this size
+max_batch_values = 2**22
+
+
+def group_matrix(grouped_data):
+    """
+    Labels, values as a groups x largest group matrix padded with NaN, and group sizes,
+    from a dictionary of values per group (such as food_found_last_timestep_per_group).
+    """
+    labels = list(grouped_data)
+    sizes = np.array([len(grouped_data[label]) for label in labels])
+    values = np.full((len(labels), sizes.max(initial=0)), np.nan)
+    for i, label in enumerate(labels):
+        values[i, :sizes[i]] = grouped_data[label]
+    return labels, values, sizes
+
+
+def batches(total, values_per_resample):
+    """
+    Sizes of the batches of resamples that keep every batch under max_batch_values values.
+    """
+    size = max(1, max_batch_values // max(values_per_resample, 1))
+    return [min(size, total - start) for start in range(0, total, size)]
+
+
+def padded_mean(values, sizes):
+    return np.where(np.isnan(values), 0, values).sum(axis=-1)/sizes
+
+
+def padded_median(values, sizes):
+    return np.nanmedian(values, axis=-1)
+
+
+def statistic_function(statistic):
+    """
+    Statistic of the rows of a NaN padded matrix, given the values and the row sizes.
+    """
+    if statistic == 'mean':
+        return padded_mean
+    if statistic == 'median':
+        return padded_median
+    raise ValueError(f"Unknown statistic '{statistic}', choose 'mean' or 'median'")
+
+
+def bootstrap_ci(grouped_data, statistic='mean', confidence=0.95, resamples=n_resamples, seed=resample_seed):
+    """
+    Percentile bootstrap confidence interval of the mean or median of every group, all groups
+    are resampled at once. Returns a dictionary per group with the estimate, low and high.
+    """
+    labels, values, sizes = group_matrix(grouped_data)
+    function = statistic_function(statistic)
+    rng = np.random.Generator(np.random.PCG64(seed))
+    # Positions past the size of a group stay NaN and are left out by the statistic
+    padding = np.arange(values.shape[1]) >= sizes[:, None]
+    rows = np.arange(len(labels))[:, None]
+    estimates = []
+    for batch in batches(resamples, values.size):
+        picks = (rng.random((batch,) + values.shape)*sizes[:, None]).astype(np.int64)
+        resampled = values[rows, picks]
+        resampled[:, padding] = np.nan
+        estimates.append(function(resampled, sizes))
+    estimates = np.concatenate(estimates)
+    alpha = (1 - confidence)/2
+    low, high = np.quantile(estimates, [alpha, 1 - alpha], axis=0)
+    observed = function(values, sizes)
+    return {label: {'estimate': observed[i], 'low': low[i], 'high': high[i]} for i, label in enumerate(labels)}
+
+
+def between_groups(pooled, offsets, sizes):
+    """
+    Between group sum of squares of the rows of pooled, whose groups are consecutive slices
+    starting at offsets. With the pooled values fixed it orders permutations like the F statistic.
+    """
+    means = np.add.reduceat(pooled, offsets, axis=-1)/sizes
+    grand_mean = pooled.mean(axis=-1, keepdims=True)
+    return ((means - grand_mean)**2*sizes).sum(axis=-1)
+
+
+def permutation_test(grouped_data, resamples=n_resamples, seed=resample_seed):
+    """
+    Permutation test of the null hypothesis that all groups come from the same distribution,
+    with the between group sum of squares as statistic (a permutation version of the one way
+    ANOVA that does not assume normality). Returns the statistic and p-value.
+    """
+    groups = [np.asarray(values, dtype=float) for values in grouped_data.values()]
+    sizes = np.array([len(values) for values in groups])
+    offsets = np.r_[0, np.cumsum(sizes)[:-1]]
+    pooled = np.concatenate(groups)
+    observed = between_groups(pooled, offsets, sizes)
+    rng = np.random.Generator(np.random.PCG64(seed))
+    exceeding = 0
+    for batch in batches(resamples, len(pooled)):
+        permuted = rng.permuted(np.broadcast_to(pooled, (batch, len(pooled))), axis=1)
+        # Tolerance for permutations that only reorder values within the groups
+        exceeding += np.count_nonzero(between_groups(permuted, offsets, sizes) >= observed*(1 - 1e-12))
+    return observed, (exceeding + 1)/(resamples + 1)
+
+
+def holm_adjust(p_values):
+    """
+    Holm-Bonferroni adjusted p-values, for the family of pairwise tests.
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    order = np.argsort(p_values)
+    adjusted = np.maximum.accumulate(p_values[order]*(len(p_values) - np.arange(len(p_values))))
+    result = np.empty_like(p_values)
+    result[order] = np.minimum(adjusted, 1)
+    return result
+
+
+def cliffs_delta(x, y):
+    """
+    Cliff's delta, the probability that a value of x is larger than one of y minus the reverse.
+    """
+    y = np.sort(y)
+    larger = np.searchsorted(y, x, side='left').sum()
+    smaller = (len(y) - np.searchsorted(y, x, side='right')).sum()
+    return (larger - smaller)/(len(x)*len(y))
+
+
+def hedges_g(x, y):
+    """
+    Standardized mean difference of x and y with the small sample correction.
+    """
+    n_x, n_y = len(x), len(y)
+    pooled_variance = ((n_x - 1)*np.var(x, ddof=1) + (n_y - 1)*np.var(y, ddof=1))/(n_x + n_y - 2)
+    correction = 1 - 3/(4*(n_x + n_y) - 9)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return correction*(np.mean(x) - np.mean(y))/np.sqrt(pooled_variance)
+
+
+def pairwise_comparisons(grouped_data, resamples=n_resamples, seed=resample_seed):
+    """
+    Every pair of groups: the difference of the means, the effect sizes (Hedges' g and Cliff's
+    delta), the permutation test p-value of the difference and the Holm adjusted p-value.
+    Returns a list of dictionaries, one per pair.
+    """
+    groups = {label: np.asarray(values, dtype=float) for label, values in grouped_data.items()}
+    comparisons = []
+    for first, second in itertools.combinations(groups, 2):
+        x, y = groups[first], groups[second]
+        _, p_value = permutation_test({first: x, second: y}, resamples, seed)
+        comparisons.append({'groups': (first, second), 'mean_difference': x.mean() - y.mean(),
+                            'hedges_g': hedges_g(x, y), 'cliffs_delta': cliffs_delta(x, y), 'p_value': p_value})
+    for comparison, adjusted in zip(comparisons, holm_adjust([comparison['p_value'] for comparison in comparisons])):
+        comparison['p_holm'] = adjusted
+    return comparisons
+
+
+def print_resampling_tests(grouped_data, name='Food found', resamples=n_resamples, seed=resample_seed):
+    """
+    Print the bootstrap intervals of the group means, the permutation test over all groups and
+    the pairwise comparisons.
+    """
+    print(f"{name}, bootstrap 95% intervals of the mean ({resamples} resamples, seed {seed}):")
+    for label, interval in bootstrap_ci(grouped_data, resamples=resamples, seed=seed).items():
+        print(f"  {label}: {interval['estimate']:.2f} [{interval['low']:.2f}, {interval['high']:.2f}]")
+    statistic, p_value = permutation_test(grouped_data, resamples, seed)
+    print(f"{name}, permutation test of all groups: between groups SS {statistic:.4g}, p = {p_value:.4g}")
+    for comparison in pairwise_comparisons(grouped_data, resamples, seed):
+        first, second = comparison['groups']
+        print(f"  {first} - {second}: difference {comparison['mean_difference']:.2f}, g {comparison['hedges_g']:.3f},"
+              f" delta {comparison['cliffs_delta']:.3f}, p = {comparison['p_value']:.4g} (Holm {comparison['p_holm']:.4g})")
+    print()
@@ -0,0 +1,82 @@
+import os
+import numpy as np
+from results_io import is_result_path, read_run
+
+
+class RunningTimeSeries:
+    def __init__(self):
+        """
+        Running mean and variance of a column per timestep over runs (Welford's algorithm),
+        and the final value and number of timesteps of every run. Memory grows with the number of timesteps, not runs.
+        """
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.final_values = []
+        # Runs stop when they reach the food target, so this is the time to the target of the runs that reached it
+        self.run_lengths = []
+
+    def add(self, timesteps, values):
+        """
+        Add the time series of one run.
+        """
+        if len(values) == 0:
+            return
+        size = int(timesteps.max()) + 1
+        if size > len(self.count):
+            grow = size - len(self.count)
+            self.count = np.r_[self.count, np.zeros(grow, dtype=np.int64)]
+            self.mean = np.r_[self.mean, np.zeros(grow)]
+            self.m2 = np.r_[self.m2, np.zeros(grow)]
+        self.count[timesteps] += 1
+        delta = values - self.mean[timesteps]
+        self.mean[timesteps] += delta / self.count[timesteps]
+        self.m2[timesteps] += delta * (values - self.mean[timesteps])
+        self.final_values.append(values[-1].item())
+        self.run_lengths.append(timesteps[-1].item() + 1)
+
+    @property
+    def runs(self):
+        return len(self.final_values)
+
+    def timesteps(self):
+        """
+        Timesteps that at least one run reached.
+        """
+        return np.flatnonzero(self.count)
+
+    def mean_std(self):
+        """
+        Mean and sample standard deviation for every timestep in timesteps(),
+        the deviation is NaN where only one run reached the timestep.
+        """
+        reached = self.count > 0
+        count = self.count[reached]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2[reached] / (count - 1))
+        std[count < 2] = np.nan
+        return self.mean[reached], std
+
+
+def aggregate_files(file_paths, column='food_found'):
+    """
+    Aggregate one column of result files, reading each file once.
+    Returns None if there are no files.
+    """
+    aggregate = RunningTimeSeries()
+    for file_path in file_paths:
+        data = read_run(file_path)
+        aggregate.add(data['timestep'], data[column])
+    if aggregate.runs == 0:
+        return None
+    return aggregate
+
+
+def aggregate_folder(folder_path, column='food_found'):
+    """
+    Aggregate one column of every result file in a folder, reading each file once.
+    Returns None if the folder holds no result files.
+    """
+    file_paths = [os.path.join(folder_path, file_name) for file_name in sorted(os.listdir(folder_path))]
+    return aggregate_files([file_path for file_path in file_paths
+                            if os.path.isfile(file_path) and is_result_path(file_path)], column)
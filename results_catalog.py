@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import sqlite3
+from results_io import extensions, is_result_path, read_binary, read_text
+
+# Run metadata that can be queried, with their SQLite types
+fields = (('maze_dimention', 'INTEGER'), ('maze_scale', 'INTEGER'), ('nPaths', 'INTEGER'), ('nAnts', 'INTEGER'),
+          ('seed', 'INTEGER'), ('iteration', 'INTEGER'), ('nStop', 'INTEGER'), ('ants_with_food_returned', 'INTEGER'),
+          ('pheromone_deposit', 'REAL'), ('decay_rate', 'REAL'), ('max_pheromone', 'REAL'), ('baseline', 'INTEGER'),
+          ('engine', 'TEXT'))
+
+# Outcomes of a run
+outcomes = (('food_found', 'INTEGER'), ('timesteps', 'INTEGER'))
+
+field_names = tuple(name for name, _ in fields + outcomes)
+
+# Lines of the text header and the metadata they hold
+header_patterns = (
+    (r'Simulation Iteration (\d+)', ('iteration',)),
+    (r'Maze Dimensions: (\d+)x\d+, Scale Factor: (\d+), Paths: (\d+)', ('maze_dimention', 'maze_scale', 'nPaths')),
+    (r'Number of Ants: (\d+), Maximum Time Steps: (\d+), Food Find Target: (\d+)', ('nAnts', 'nStop', 'ants_with_food_returned')),
+    (r'Initial Random Seed: (\d+)', ('seed',)),
+    (r'Pheromone decay rate: ([^,]+), Deposit rate: ([^,]+), Max: ([0-9.eE+-]+)', ('decay_rate', 'pheromone_deposit', 'max_pheromone')),
+    (r'Baseline: (True|False)', ('baseline',)),
+)
+
+
+def parse_text_header(lines):
+    """
+    Metadata of a run from the header lines of a text result file.
+    """
+    header = ''.join(lines)
+    metadata = {}
+    for pattern, names in header_patterns:
+        match = re.search(pattern, header)
+        if match is None:
+            continue
+        for name, value in zip(names, match.groups()):
+            if name == 'baseline':
+                metadata[name] = value == 'True'
+            elif dict(fields)[name] == 'INTEGER':
+                metadata[name] = int(value)
+            else:
+                metadata[name] = float(value)
+    # The header counts iterations from one
+    if 'iteration' in metadata:
+        metadata['iteration'] -= 1
+    return metadata
+
+
+def read_summary(path):
+    """
+    Metadata and outcomes of a result file in either format.
+    """
+    if path.endswith(extensions['binary']):
+        metadata, data = read_binary(path)
+    else:
+        header, data = read_text(path)
+        metadata = parse_text_header(header)
+    timesteps = data['timestep']
+    metadata['food_found'] = int(data['food_found'][-1]) if len(timesteps) else 0
+    metadata['timesteps'] = int(timesteps[-1]) + 1 if len(timesteps) else 0
+    return metadata
+
+
+class ResultsCatalog:
+    def __init__(self, path='sim_results/catalog.sqlite'):
+        """
+        SQLite index of result files with their parameters and outcomes, so analyses can
+        select runs by parameter values without walking folders and parsing headers.
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        columns = ', '.join(f'{name} {kind}' for name, kind in fields + outcomes)
+        with self.connection:
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS runs (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, '
+                                    f'{columns}, metadata TEXT)')
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _upsert(self, path, metadata, stat=None):
+        path = os.path.abspath(path)
+        mtime, size = (stat.st_mtime, stat.st_size) if stat is not None else (None, None)
+        values = [metadata.get(name) for name in field_names]
+        placeholders = ', '.join('?'*(len(field_names) + 4))
+        self.connection.execute(f'INSERT OR REPLACE INTO runs (path, mtime, size, {", ".join(field_names)}, metadata) '
+                                f'VALUES ({placeholders})', [path, mtime, size] + values + [json.dumps(metadata)])
+
+    def record_run(self, path, metadata, food_found, timesteps):
+        """
+        Add a run as it finishes. The file may still be being written, then its
+        modification time is left empty and the next index_folder reads it again.
+        """
+        metadata = dict(metadata, food_found=food_found, timesteps=timesteps)
+        stat = os.stat(path) if os.path.exists(path) else None
+        with self.connection:
+            self._upsert(path, metadata, stat)
+
+    def index_folder(self, folder):
+        """
+        Add the result files below a folder, only files that are new or changed since they
+        were indexed are read. Entries of files that no longer exist are removed.
+        Returns the number of files that were read.
+        """
+        where, values = self._where(folder, {})
+        known = {row['path']: (row['mtime'], row['size']) for row in
+                 self.connection.execute(f'SELECT path, mtime, size FROM runs{where}', values)}
+        found = set()
+        read = 0
+        with self.connection:
+            for directory, _, file_names in os.walk(os.path.abspath(folder)):
+                for file_name in sorted(file_names):
+                    if not is_result_path(file_name):
+                        continue
+                    path = os.path.join(directory, file_name)
+                    found.add(path)
+                    stat = os.stat(path)
+                    if known.get(path) == (stat.st_mtime, stat.st_size):
+                        continue
+                    try:
+                        metadata = read_summary(path)
+                    except (OSError, ValueError, KeyError) as error:
+                        print(f"Skipping unreadable result file {path}: {error}")
+                        continue
+                    self._upsert(path, metadata, stat)
+                    read += 1
+            removed = [(path,) for path in known if path not in found]
+            self.connection.executemany('DELETE FROM runs WHERE path = ?', removed)
+        return read
+
+    def _where(self, folder, filters):
+        unknown = set(filters) - set(field_names)
+        if unknown:
+            raise ValueError(f"Unknown fields {sorted(unknown)}, choose from {list(field_names)}")
+        clauses = []
+        values = []
+        if folder is not None:
+            # Prefix comparison, LIKE would treat the underscores of folder names as wildcards
+            prefix = os.path.join(os.path.abspath(folder), '')
+            clauses.append('substr(path, 1, ?) = ?')
+            values.extend((len(prefix), prefix))
+        for name, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                clauses.append(f'{name} IN ({", ".join("?"*len(value))})')
+                values.extend(value)
+            else:
+                clauses.append(f'{name} = ?')
+                values.append(value)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), values
+
+    def query(self, folder=None, **filters):
+        """
+        Runs whose fields equal the given values (or are in the given lists), as dictionaries
+        with the path, the queryable fields and the outcomes. With a folder only the runs
+        below that folder are selected.
+        """
+        where, values = self._where(folder, filters)
+        rows = self.connection.execute(f'SELECT path, {", ".join(field_names)} FROM runs{where} ORDER BY path', values)
+        return [dict(row) for row in rows]
+
+    def groups(self, by, folder=None, **filters):
+        """
+        Paths of the selected runs grouped by the value of a field, in order of that value.
+        """
+        if by not in field_names:
+            raise ValueError(f"Unknown field '{by}', choose from {list(field_names)}")
+        grouped = {}
+        for run in sorted(self.query(folder, **filters), key=lambda run: (run[by] is None, run[by])):
+            grouped.setdefault(run[by], []).append(run['path'])
+        return grouped
@@ -0,0 +1,190 @@
+import json
+import multiprocessing.util
+import os
+import queue
+import threading
+import numpy as np
+
+# Columns of a run time series, as (key in binary files, name in text files and DataFrames)
+columns = (('timestep', 'Timestep'), ('food_found', 'Food Found'), ('ants_food', 'AntsFood'))
+
+# Header line above the time series in text files
+text_header = 'Timestep, Food Found, AntsFood'
+
+# File extensions of the output formats
+extensions = {'text': '.txt', 'binary': '.npz'}
+
+# Suffix of the checkpoint of a run after its result file name (see checkpoint.py),
+# earlier versions added '.npz' after it
+checkpoint_suffix = '.checkpoint'
+
+
+class TimeSeriesBuffer:
+    def __init__(self, capacity):
+        """
+        Preallocated columns for the time series of one run.
+        """
+        self.data = {key: np.empty(capacity, dtype=np.int32) for key, _ in columns}
+        self.length = 0
+
+    def append(self, timestep, food_found, ants_food):
+        """
+        Add the values of one timestep.
+        """
+        i = self.length
+        self.data['timestep'][i] = timestep
+        self.data['food_found'][i] = food_found
+        self.data['ants_food'][i] = ants_food
+        self.length += 1
+
+    def columns(self):
+        """
+        The filled part of the columns.
+        """
+        return {key: values[:self.length] for key, values in self.data.items()}
+
+
+def write_binary(path, metadata, data):
+    """
+    Write a run as an .npz file with the metadata as a JSON header.
+    The file is written under a temporary name first, so readers never see half a file.
+    """
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        np.savez(file, metadata=np.array(json.dumps(metadata)), **data)
+    os.replace(temporary_path, path)
+
+
+def write_text(path, metadata, data):
+    """
+    Write a run in the original text format, under a temporary name first like write_binary.
+    """
+    lines = [f"Simulation Iteration {metadata['iteration'] + 1}\n",
+             f"Maze Dimensions: {metadata['maze_dimention']}x{metadata['maze_dimention']}, Scale Factor: {metadata['maze_scale']}, Paths: {metadata['nPaths']}\n",
+             f"Number of Ants: {metadata['nAnts']}, Maximum Time Steps: {metadata['nStop']}, Food Find Target: {metadata['ants_with_food_returned']}\n",
+             f"Initial Random Seed: {metadata['seed']}\n",
+             f"Pheromone decay rate: {metadata['decay_rate']}, Deposit rate: {metadata['pheromone_deposit']}, Max: {metadata['max_pheromone']}",
+             "Baseline: True\n" if metadata['baseline'] else "Baseline: False",
+             "Starting simulation\n\n",
+             text_header + "\n"]
+    lines.extend(f"{t}, {food_found}, {ants_food}\n"
+                 for t, food_found, ants_food in zip(*(data[key].tolist() for key, _ in columns)))
+    temporary_path = path + '.tmp'
+    with open(temporary_path, "w") as file:
+        file.writelines(lines)
+    os.replace(temporary_path, path)
+
+
+def write_result(path, metadata, data, output_format='binary'):
+    """
+    Write a run in the given output format.
+    """
+    if output_format == 'binary':
+        write_binary(path, metadata, data)
+    elif output_format == 'text':
+        write_text(path, metadata, data)
+    else:
+        raise ValueError(f"Unknown output format '{output_format}', choose from {list(extensions)}")
+
+
+def read_binary(path):
+    """
+    Read a run written by write_binary, returns the metadata and the columns.
+    """
+    with np.load(path) as file:
+        metadata = json.loads(str(file['metadata']))
+        data = {key: file[key] for key, _ in columns}
+    return metadata, data
+
+
+def read_text(path):
+    """
+    Read a run in the text format in one pass, returns the header lines and the columns.
+    """
+    with open(path) as file:
+        lines = file.readlines()
+    start = next((i + 1 for i, line in enumerate(lines) if text_header in line), 0)
+    rows = [line for line in lines[start:] if line.strip()]
+    if rows:
+        values = np.loadtxt(rows, delimiter=',', dtype=np.int64, ndmin=2)
+    else:
+        values = np.empty((0, len(columns)), dtype=np.int64)
+    data = {key: values[:, i] for i, (key, _) in enumerate(columns)}
+    return lines[:start], data
+
+
+def is_result_path(path):
+    """
+    Whether a file name is a result file of one of the output formats, checkpoints are not.
+    """
+    return path.endswith(tuple(extensions.values())) and checkpoint_suffix not in os.path.basename(path)
+
+
+def read_run(path):
+    """
+    Read the columns of a run in either format.
+    """
+    if path.endswith(extensions['binary']):
+        return read_binary(path)[1]
+    return read_text(path)[1]
+
+
+class ResultWriter:
+    def __init__(self):
+        """
+        Writes result files on a background thread, so the simulation does not wait for the disk.
+        """
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def submit(self, path, metadata, data, output_format='binary', on_written=None):
+        """
+        Queue a run to be written, the columns must not be changed afterwards.
+        on_written() is called on the writer thread once the file is complete.
+        """
+        if self.thread is None:
+            # A daemon, so the exit handlers that close the writer are not blocked by it
+            self.thread = threading.Thread(target=self.work, name='result-writer', daemon=True)
+            self.thread.start()
+        self.queue.put((path, metadata, data, output_format, on_written))
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            path, metadata, data, output_format, on_written = job
+            try:
+                write_result(path, metadata, data, output_format)
+                if on_written is not None:
+                    on_written()
+            except Exception as error:
+                print(f"Failed to write {job[0]}: {error}")
+
+    def close(self):
+        """
+        Wait until every queued run is written.
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+# Writer of this process and the process it belongs to
+_writer = None
+_writer_pid = None
+
+
+def background_writer():
+    """
+    Return the result writer of this process. It is closed by the multiprocessing exit
+    handlers, so pool workers write their last results before they exit.
+    """
+    global _writer, _writer_pid
+    # A forked worker must not use the writer thread of its parent
+    if _writer is None or _writer_pid != os.getpid():
+        _writer = ResultWriter()
+        _writer_pid = os.getpid()
+        multiprocessing.util.Finalize(_writer, _writer.close, exitpriority=10)
+    return _writer
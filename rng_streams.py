@@ -0,0 +1,118 @@
+import hashlib
+import json
+import numpy as np
+
+# Number of random numbers drawn from the generator at once
+block_size = 4096
+
+
+class BlockRandom:
+    def __init__(self, generator, block_size=block_size):
+        """
+        Uniform random numbers in [0, 1) from a numpy Generator, drawn in blocks so the
+        per-ant draws of the step loop are a list lookup instead of a call into numpy.
+        Single numbers and arrays come from the same sequence: the numbers are the same
+        as generator.random(n) for any block size and any mix of random and random_array.
+        """
+        self.generator = generator
+        self.block_size = block_size
+        self.array = np.empty(0)
+        self.values = []
+        self.index = 0
+
+    def refill(self):
+        self.array = self.generator.random(self.block_size)
+        self.values = self.array.tolist()
+        self.index = 0
+
+    def random(self):
+        """
+        The next random number as a Python float.
+        """
+        i = self.index
+        if i == len(self.values):
+            self.refill()
+            i = 0
+        self.index = i + 1
+        return self.values[i]
+
+    def random_array(self, n):
+        """
+        The next n random numbers as an array.
+        """
+        i = self.index
+        available = len(self.values) - i
+        if n <= available:
+            self.index = i + n
+            return self.array[i:i + n]
+        # Use up the block and draw the rest directly, the generator continues where the block ended
+        numbers = np.concatenate((self.array[i:], self.generator.random(n - available)))
+        self.array = np.empty(0)
+        self.values = []
+        self.index = 0
+        return numbers
+
+    def peek(self, n):
+        """
+        The next n random numbers without using them, for consumers that only know afterwards
+        how many they needed. advance(k) then uses the first k of them.
+        """
+        if len(self.values) - self.index < n:
+            self.array = np.concatenate((self.array[self.index:], self.generator.random(max(self.block_size, n))))
+            self.values = self.array.tolist()
+            self.index = 0
+        return self.array[self.index:self.index + n]
+
+    def advance(self, k):
+        self.index += k
+
+    def get_state(self):
+        """
+        State of the generator and the numbers of the block that are not used yet.
+        """
+        return {'bit_generator': self.generator.bit_generator.state, 'block': self.array[self.index:].copy()}
+
+    def set_state(self, state):
+        self.generator.bit_generator.state = state['bit_generator']
+        self.array = np.asarray(state['block'], dtype=float)
+        self.values = self.array.tolist()
+        self.index = 0
+
+
+def new_root_seed():
+    """
+    A fresh root seed from the operating system, print or store it to repeat a sweep.
+    """
+    return np.random.SeedSequence().entropy
+
+
+def key_words(key):
+    """
+    Stable integer for any JSON serializable key, such as the parameters of a sweep cell.
+    """
+    text = json.dumps(key, sort_keys=True, default=str)
+    return int.from_bytes(hashlib.sha1(text.encode()).digest()[:8], 'little')
+
+
+def stream_seed(root_seed, cell, replicate):
+    """
+    Node of the seed tree for one replicate of one sweep cell. The node only depends on the
+    root seed, the cell and the replicate number, not on the order in which runs are made.
+    """
+    return np.random.SeedSequence(root_seed, spawn_key=(key_words(cell), replicate))
+
+
+def replicate_stream(root_seed, cell, replicate):
+    """
+    Random stream of one replicate of a sweep cell.
+    """
+    return BlockRandom(np.random.Generator(np.random.PCG64(stream_seed(root_seed, cell, replicate))))
+
+
+def derive_seeds(root_seed, name, count, upper=2**31):
+    """
+    count integer seeds below upper derived from the root seed, for generators outside the
+    tree such as the maze generator.
+    """
+    generator = np.random.Generator(np.random.PCG64(np.random.SeedSequence(root_seed, spawn_key=(key_words(name),))))
+    return generator.integers(0, upper, count).tolist()
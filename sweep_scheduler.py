@@ -0,0 +1,138 @@
+import functools
+import multiprocessing as mp
+import time
+import numpy as np
+import ant_model_walkback as amw
+import maze_cache
+import maze_index
+import rng_streams
+from profiling import format_summary
+from maze_generator_with_nPaths import generate_maze_with_paths, upscale_maze
+
+
+def make_spec(name, seed, nStop, **parameters):
+    """
+    Build a run specification. The simulation parameters are the current values in
+    ant_model_walkback with the given ones replacing them, so a spec holds every
+    parameter the run needs and does not depend on the globals of the worker.
+    Extra keys that the run function needs can be added to the returned dictionary.
+    """
+    run_parameters = amw.get_parameters()
+    run_parameters.update(parameters)
+    return {'name': name, 'seed': seed, 'nStop': nStop, 'parameters': run_parameters}
+
+
+def spec_cell(spec):
+    """
+    Sweep cell of a run, the runs of a cell only differ in their replicate number. Specs can
+    name their cell with a 'cell' key, otherwise the maze seed and parameters identify it.
+    Parameters that are None (options that are off) are left out, so adding an optional
+    parameter keeps the random streams of earlier sweeps.
+    """
+    if 'cell' in spec:
+        return spec['cell']
+    parameters = {name: value for name, value in spec['parameters'].items() if value is not None}
+    return [spec['seed'], spec['nStop'], parameters]
+
+
+def replicate_streams(spec):
+    """
+    Random streams of the replicates of a run, derived from the 'root_seed' of the spec,
+    its cell and its replicate numbers ('replicate' is the first, a run has 'replicates' of them).
+    None if the spec has no root seed, the run then uses the global numpy random state.
+    """
+    if spec.get('root_seed') is None:
+        return None
+    first = spec.get('replicate', 0)
+    cell = spec_cell(spec)
+    return [rng_streams.replicate_stream(spec['root_seed'], cell, first + k) for k in range(spec.get('replicates', 1))]
+
+
+def run_stream(spec):
+    """
+    Random stream of a run with a single replicate, None without a root seed.
+    """
+    streams = replicate_streams(spec)
+    return None if streams is None else streams[0]
+
+
+def estimate_cost(spec):
+    """
+    Rough cost of a run, the number of ant-steps it can take at most.
+    """
+    parameters = spec['parameters']
+    return spec['nStop']*parameters['nAnts']*spec.get('replicates', 1)
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_maze(dimension, nPaths, seed, scale):
+    maze = generate_maze_with_paths(dimension, dimension, nPaths, randomseed=seed)
+    return upscale_maze(maze, scale)
+
+
+def build_maze(spec):
+    """
+    Maze of a run. Mazes are kept in the disk cache of maze_cache, so every maze is generated once
+    and the workers map the same file. Without the disk cache mazes are kept per worker.
+    """
+    parameters = spec['parameters']
+    key = (parameters['maze_dimention'], parameters['nPaths'], spec['seed'], parameters['maze_scale'])
+    cache = maze_cache.default_cache()
+    # The model loads the index of the maze from the same cache
+    maze_index.persistent_cache = cache
+    if cache is None:
+        return _cached_maze(*key).copy()
+    # Copy-on-write mapping, placing the colony and food does not change the cached maze
+    return cache.maze(*key)
+
+
+def _execute(job):
+    """
+    Run one specification in a worker with its parameters applied.
+    """
+    target, index, spec = job
+    amw.set_parameters(**spec['parameters'])
+    # Runs without a root seed use the global random state, fresh entropy unless the spec fixes it
+    np.random.seed(spec.get('rng_seed'))
+    start_time = time.perf_counter()
+    result = target(spec)
+    if result is None:
+        result = {}
+    result['wall_time'] = time.perf_counter() - start_time
+    return index, result
+
+
+def run_sweep(target, specs, processes=None, chunksize=1, on_result=None, progress=True):
+    """
+    Run target(spec) for every specification on a pool of processes worker processes
+    (all cores by default), starting with the most expensive runs.
+    Returns the results in the order of specs, each result is the dictionary returned
+    by target with the wall time of the run added. on_result(spec, result) is called
+    in this process as runs finish. The 'profile' of a result (profiling.PhaseProfiler.summary)
+    is printed with its progress line.
+    """
+    order = sorted(range(len(specs)), key=lambda i: estimate_cost(specs[i]), reverse=True)
+    jobs = [(target, i, specs[i]) for i in order]
+    results = [None]*len(specs)
+    start_time = time.time()
+
+    pool = mp.Pool(processes)
+    try:
+        for finished, (index, result) in enumerate(pool.imap_unordered(_execute, jobs, chunksize), start=1):
+            results[index] = result
+            if progress:
+                print(f"[{finished}/{len(specs)}] {specs[index]['name']} finished in {result['wall_time']:.2f} s"
+                      f" --- {time.time() - start_time:.1f} seconds ---")
+                if 'profile' in result:
+                    print(f"    {format_summary(result['profile'])}")
+            if on_result is not None:
+                on_result(specs[index], result)
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        # Close instead of terminate so workers can finish their cleanup
+        pool.close()
+    finally:
+        pool.join()
+    return results
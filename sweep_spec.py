@@ -0,0 +1,154 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import ant_model_walkback as amw
+import headless_simulation as hs
+from checkpoint import checkpoint_path
+from results_io import extensions
+from rng_streams import derive_seeds, new_root_seed
+from sweep_scheduler import make_spec
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+# Modules whose source decides the outcome of a run, their contents are the code version in every run hash:
+# the engines, and the run loop of headless_simulation with the modules it builds, resumes and writes runs with
+code_modules = ('ant_model_walkback', 'maze_generator_with_nPaths', 'maze_index', 'pheromone_store', 'vectorized_model',
+                'jit_kernel', 'rng_streams', 'engines', 'headless_simulation', 'sweep_scheduler', 'distance_fields',
+                'checkpoint', 'results_io')
+
+# Run options of headless_simulation that a sweep file can set, with their defaults
+run_options = {'output_format': 'binary', 'checkpoint_every': hs.checkpoint_every, 'keep_checkpoints': False,
+               'record_every': None, 'record_dtype': 'float16', 'profile': False, 'path_metrics': True,
+               'pheromone_dtype': 'float64', 'tiled_pheromones': False}
+
+# Upper bound of the derived maze seeds
+max_maze_seed = 2**31
+
+
+def code_version():
+    """
+    Hash of the source of the code_modules. Line endings are normalized, so checkouts with
+    CRLF and LF line endings have the same version.
+    """
+    digest = hashlib.sha1()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for module in code_modules:
+        with open(os.path.join(folder, f'{module}.py'), 'rb') as file:
+            digest.update(file.read().replace(b'\r\n', b'\n'))
+    return digest.hexdigest()[:16]
+
+
+def load_sweep(path):
+    """
+    Read a sweep file (.toml or .json) and check its names. A sweep has a name, a root_seed,
+    the fixed parameters, the parameter axes (every combination is run), the maze seeds
+    (a list of seeds or a count derived from the root seed), the number of replicates,
+    the stop criteria (nStop, ants_with_food_returned) and optional run options.
+    """
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise ValueError("TOML sweep files need Python 3.11 or later, use a .json file")
+        with open(path, 'rb') as file:
+            sweep = tomllib.load(file)
+    else:
+        with open(path) as file:
+            sweep = json.load(file)
+
+    if 'root_seed' not in sweep:
+        raise ValueError(f"{path} has no root_seed, runs can only be reused with a fixed one, for example {new_root_seed()}")
+    stop = dict(sweep.get('stop', {}))
+    names = set(sweep.get('parameters', {})) | set(sweep.get('axes', {})) | (set(stop) - {'nStop'})
+    unknown = names - set(amw.parameter_names)
+    if unknown:
+        raise ValueError(f"Unknown simulation parameters in {path}: {sorted(unknown)}")
+    unknown = set(sweep.get('options', {})) - set(run_options)
+    if unknown:
+        raise ValueError(f"Unknown run options in {path}: {sorted(unknown)}, choose from {list(run_options)}")
+    sweep.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    sweep.setdefault('folder', os.path.join('sim_results', sweep['name']))
+    return sweep
+
+
+def maze_seeds(sweep):
+    """
+    Maze seeds of a sweep, a count derives them from the root seed so raising it only adds seeds.
+    """
+    mazes = sweep.get('mazes', {'seeds': [16436]})
+    if 'seeds' in mazes:
+        return list(mazes['seeds'])
+    return derive_seeds(sweep['root_seed'], 'maze', mazes['count'], max_maze_seed)
+
+
+def run_hash(spec, version):
+    """
+    Hash of everything that decides the outcome of a run: all simulation parameters, the maze
+    seed, the stop criteria, the random stream, the engine and pheromone type and the code version.
+    """
+    key = {'parameters': spec['parameters'], 'seed': spec['seed'], 'nStop': spec['nStop'], 'root_seed': spec['root_seed'],
+           'replicate': spec['replicate'], 'engine': spec['engine'], 'pheromone_dtype': spec['pheromone_dtype'],
+           'code_version': version}
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def expand(sweep):
+    """
+    Run specifications for every combination of the axes, maze seed and replicate. The result
+    file of a run is named after its hash, so a run keeps its file when the sweep grows.
+    """
+    version = sweep.get('code_version') or code_version()
+    stop = dict(sweep.get('stop', {}))
+    nStop = stop.pop('nStop', amw.ntimeSteps)
+    options = dict(run_options, **sweep.get('options', {}))
+    axes = sweep.get('axes', {})
+    defaults = amw.get_parameters()
+    specs = []
+    for values in itertools.product(*axes.values()):
+        # Set through ant_model_walkback so the colony and food follow a changed maze size
+        amw.set_parameters(**dict(sweep.get('parameters', {}), **stop, **dict(zip(axes, values))))
+        parameters = amw.get_parameters()
+        amw.set_parameters(**defaults)
+        label = ', '.join(f'{name} {value}' for name, value in zip(axes, values))
+        for seed in maze_seeds(sweep):
+            for replicate in range(sweep.get('replicates', 1)):
+                spec = make_spec(f"{label}, maze {seed}, replicate {replicate}", seed, nStop, **parameters)
+                spec.update(options)
+                spec['iteration'] = replicate
+                spec['replicate'] = replicate
+                spec['root_seed'] = sweep['root_seed']
+                spec['engine'] = sweep.get('engine', 'python')
+                spec['resume'] = True
+                spec['run_hash'] = run_hash(spec, version)
+                spec['code_version'] = version
+                spec['filename'] = os.path.join(sweep['folder'], f"{spec['run_hash'][:20]}{extensions[spec['output_format']]}")
+                specs.append(spec)
+    return specs
+
+
+def run_sweep_file(path, processes=None, dry_run=False):
+    """
+    Run the runs of a sweep file that have no results yet, runs with a checkpoint continue from it.
+    Returns the specifications of all runs of the sweep.
+    """
+    sweep = load_sweep(path)
+    specs = expand(sweep)
+    pending = [spec for spec in specs if not hs.run_finished(spec, checkpoint_path(spec['filename']))]
+    print(f"{sweep['name']}: {len(specs)} runs, {len(specs) - len(pending)} done, {len(pending)} to run")
+    if pending and not dry_run:
+        os.makedirs(sweep['folder'], exist_ok=True)
+        catalog_path = sweep.get('catalog', os.path.join(sweep['folder'], 'catalog.sqlite'))
+        hs.run_catalogued_sweep(pending, processes, catalog_path)
+    return specs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the missing runs of a declarative sweep')
+    parser.add_argument('sweep', help='sweep file (.toml or .json)')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes, all cores by default')
+    parser.add_argument('--dry-run', action='store_true', help='only count the runs that are done and to do')
+    args = parser.parse_args()
+    run_sweep_file(args.sweep, args.processes, args.dry_run)
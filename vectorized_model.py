@@ -0,0 +1,400 @@
+import numpy as np
+import ant_model_walkback as amw
+from maze_index import MazeIndex, opposite
+from pheromone_store import PheromoneStore
+
+
+class VectorModel:
+    def __init__(self, maze, width, height, replicates=1, rng=None):
+        """
+        Initialize the model with the state of every ant stored in NumPy arrays,
+        so one timestep advances all ants with batched array operations.
+        With replicates > 1 the model runs independent replicates of the same maze side by side.
+        rng is the random stream of the run, or a list with the stream of every replicate
+        (rng_streams.BlockRandom), without it the global numpy random state is used.
+        """
+        self.width = width
+        self.height = height
+        self.nAnts = amw.nAnts
+        self.nWaveAnts = amw.nWaveAnts
+        self.WaveTimesteps = amw.WaveTimesteps
+        self.total_ants_spawned = 0
+        self.replicates = replicates
+        if rng is not None and not isinstance(rng, (list, tuple)):
+            rng = [rng]
+        if rng is not None and len(rng) != replicates:
+            raise ValueError(f"Expected {replicates} random streams, got {len(rng)}")
+        self.rngs = rng
+        # Optional recorder.RunRecorder that stores the state of replicate 0 after every update
+        self.recorder = None
+        # Optional profiling.PhaseProfiler that times the phases of every update
+        self.profiler = None
+
+        # Our grid is a maze with walls (2) and open spaces (0)
+        self.grid = maze
+
+        # We initialize colony in the top left and the food at the bottom right
+        self.colony_position = amw.colony_position
+        self.food_position = amw.food_position
+
+        # Colony is represented as a -1 and food as a 1
+        self.grid[self.colony_position] = amw.colony
+        self.grid[self.food_position] = amw.food
+
+        # Track the food deliverd
+        self.food_found = 0
+
+        # Track if food is discovered
+        self.food_discovered = False
+
+        # Ants address cells by their id in the maze index
+        self.maze_index = MazeIndex.for_grid(self.grid)
+        self.neighbor_table = self.maze_index.neighbor_table
+        self.cell_types = self.maze_index.cell_types
+        self.n_cells = self.maze_index.n_cells
+        self.colony_cell = self.maze_index.cell_of(self.colony_position)
+        self.max_moves = amw.wander_limit(self.maze_index, self.colony_position, self.food_position)
+        # Initialize pheromone store, it only keeps the open cells
+        self.pheromone_store = PheromoneStore(self.maze_index, replicates)
+        self.pheromone_values = self.pheromone_store.values
+
+        # Replicates that are still running. Ant slots are ordered ant by ant, slot
+        # i*len(lanes) + k holds ant i of replicate lanes[k], so the spawned ants are a prefix
+        self.lanes = np.arange(replicates)
+
+        # Ant state, one row per ant slot. Paths are stored as the directions taken from
+        # the colony and the visited cells as one bit per cell
+        n_slots = self.nAnts*replicates
+        self.position = np.full(n_slots, self.colony_cell, dtype=np.int64)
+        self.hasfood = np.zeros(n_slots, dtype=bool)
+        self.path_length = np.ones(n_slots, dtype=np.int64)
+        self.final_path_length = np.zeros(n_slots, dtype=np.int64)
+        self.moves = np.zeros((n_slots, 64), dtype=np.uint8)
+        self.visited = np.zeros((n_slots, (self.n_cells + 7) // 8), dtype=np.uint8)
+        self.mark_visited(np.arange(n_slots), self.position)
+
+    def spawn_ants(self):
+        """
+        Spawn a wave of ants if the maximum number of ants has not been reached.
+        """
+        if self.total_ants_spawned < self.nAnts:
+            new_ants = min(self.nWaveAnts, self.nAnts - self.total_ants_spawned)
+            # Ant rows are initialized at the colony, spawning only activates them
+            self.total_ants_spawned += new_ants
+
+    @property
+    def pheromones(self):
+        """
+        Pheromone levels as a grid of the maze shape.
+        """
+        return self.pheromone_store.dense()
+
+    def count_ants_with_food(self):
+        """
+        Number of ants currently carrying food.
+        """
+        return int(np.count_nonzero(self.hasfood[:self.total_ants_spawned*len(self.lanes)]))
+
+    def lane_slots(self, replicate=0):
+        """
+        Slots of the spawned ants of one replicate.
+        """
+        slots = np.arange(self.total_ants_spawned*len(self.lanes))
+        return slots[self.replicate_of(slots) == replicate]
+
+    def ant_states(self, replicate=0):
+        """
+        Cell ids and food flags of the spawned ants of one replicate as two arrays.
+        """
+        slots = self.lane_slots(replicate)
+        return self.position[slots], self.hasfood[slots]
+
+    def ant_positions(self, replicate=0):
+        """
+        Positions (x, y) of the ants without food and of the ants with food of one replicate, as two (n, 2) arrays.
+        """
+        cells, hasfood = self.ant_states(replicate)
+        coords = self.maze_index.coords[cells]
+        return coords[~hasfood], coords[hasfood]
+
+    def replicate_of(self, slots):
+        """
+        Replicate that the ants in the slots belong to.
+        """
+        return self.lanes[slots % len(self.lanes)]
+
+    def ant_path_lengths(self, replicate=0):
+        """
+        Moves on the path of every spawned ant of a replicate and the length of its last path to the food.
+        """
+        slots = self.lane_slots(replicate)
+        return self.path_length[slots] - 1, self.final_path_length[slots].copy()
+
+    def get_state(self):
+        """
+        State of a run with one replicate in the format of Model.get_state.
+        """
+        if len(self.lanes) != 1 or self.replicates != 1:
+            raise ValueError("Only the state of a model with one replicate can be saved")
+        n = self.total_ants_spawned
+        # Path lengths count the cells on the path, the colony included
+        move_counts = self.path_length[:n] - 1
+        has_move = np.arange(self.moves.shape[1]) < move_counts[:, None]
+        state = self.pheromone_store.get_state()
+        state.update(total_ants_spawned=n, food_found=self.food_found, food_discovered=self.food_discovered,
+                     ants_with_food=self.count_ants_with_food(), ant_cell=self.position[:n].copy(),
+                     ant_hasfood=self.hasfood[:n].copy(), ant_final_path_length=self.final_path_length[:n].copy(),
+                     ant_move_counts=move_counts, ant_moves=self.moves[:n][has_move], ant_visited=self.visited[:n].copy())
+        return state
+
+    def set_state(self, state):
+        """
+        Continue from a state returned by get_state.
+        """
+        if self.replicates != 1:
+            raise ValueError("Only a model with one replicate can be restored")
+        self.pheromone_store.set_state(state)
+        n = self.total_ants_spawned = int(state['total_ants_spawned'])
+        self.food_found = int(state['food_found'])
+        self.food_discovered = bool(state['food_discovered'])
+        move_counts = np.asarray(state['ant_move_counts'], dtype=np.int64)
+        while n and move_counts.max() + 1 > self.moves.shape[1]:
+            self.moves = np.concatenate((self.moves, np.zeros_like(self.moves)), axis=1)
+        self.position[:n] = state['ant_cell']
+        self.hasfood[:n] = state['ant_hasfood']
+        self.final_path_length[:n] = state['ant_final_path_length']
+        self.path_length[:n] = move_counts + 1
+        self.moves[:n][np.arange(self.moves.shape[1]) < move_counts[:, None]] = state['ant_moves']
+        self.visited[:n] = state['ant_visited']
+
+    def update(self, timestep):
+        """
+        Update the positions of all ants and pheromones in the grid.
+        """
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        if timestep % self.WaveTimesteps == 0:
+            self.spawn_ants()
+        if profiler is not None:
+            profiler.lap('spawn')
+
+        self.pheromone_store.decay(amw.decay_rate)
+        if profiler is not None:
+            profiler.lap('decay')
+        n = self.total_ants_spawned*len(self.lanes)
+        if n == 0:
+            if self.recorder is not None:
+                self.recorder.record(timestep, self)
+            return
+
+        position = self.position[:n]
+        hasfood = self.hasfood[:n]
+        path_length = self.path_length[:n]
+        cell_value = self.cell_types[position]
+
+        # Check if the ants found food
+        hasfood |= cell_value == amw.food
+        at_colony = position == self.colony_cell
+        # Ants standing on the colony with food drop it without it counting as delivered
+        dropped = hasfood & at_colony
+        returning = hasfood & ~at_colony
+
+        pickup = returning & (cell_value == amw.food)
+        self.final_path_length[:n][pickup] = path_length[pickup]
+
+        # Walkback deposit scaled by the path length, as in Ant.step
+        depositing = np.flatnonzero(returning & (cell_value >= 0) & (cell_value < 1))
+        deposit_cells = self.replicate_of(depositing)*self.n_cells + position[depositing]
+        deposit_amounts = amw.pheromone_deposit*(((path_length[depositing]/self.final_path_length[depositing]) / amw.decay_strength)**2)
+        deposit_keys, deposit_levels = self.ordered_deposits(depositing, deposit_cells, deposit_amounts)
+        if profiler is not None:
+            profiler.lap('deposit')
+
+        # Searching ants choose a neighbor before this timestep's deposits are written,
+        # the ones at the wander limit turn back without choosing
+        searching = np.flatnonzero(~hasfood)
+        choosing = searching[path_length[searching] <= self.max_moves]
+        movers, directions = self.choose_cells_based_on_pheromones(choosing, deposit_keys, deposit_levels)
+        if profiler is not None:
+            profiler.lap('movement')
+        if len(deposit_keys):
+            n_slots = len(self.position)
+            last = np.r_[deposit_keys[1:]//n_slots != deposit_keys[:-1]//n_slots, True]
+            self.pheromone_store.set(deposit_keys[last]//n_slots, deposit_levels[last])
+        if profiler is not None:
+            profiler.lap('deposit')
+
+        # Ants that did not move forward step back along their path, ants without moves stay
+        backtracking = returning.copy()
+        backtracking[searching] = True
+        backtracking[movers] = False
+        stepped_back = np.flatnonzero(backtracking & (path_length > 1))
+        path_length[stepped_back] -= 1
+        back = opposite(self.moves[stepped_back, path_length[stepped_back] - 1])
+        position[stepped_back] = self.neighbor_table[position[stepped_back], back]
+
+        # Move the ants that found an unvisited neighbor
+        if len(movers) and path_length[movers].max() > self.moves.shape[1]:
+            self.moves = np.concatenate((self.moves, np.zeros_like(self.moves)), axis=1)
+        position[movers] = self.neighbor_table[position[movers], directions]
+        self.moves[movers, path_length[movers] - 1] = directions
+        path_length[movers] += 1
+        self.mark_visited(movers, position[movers])
+        if profiler is not None:
+            profiler.lap('movement')
+            profiler.count('backtracks', int(np.count_nonzero(~hasfood[stepped_back])))
+
+        # Check if ants have returned the food to the colony
+        delivered = np.flatnonzero(hasfood & (position == self.colony_cell))
+        if len(delivered):
+            self.food_discovered = True
+            self.record_deliveries(delivered)
+        self.reset_ants(np.flatnonzero(dropped))
+        self.reset_ants(delivered)
+        if profiler is not None:
+            profiler.lap('delivery')
+            profiler.count('timesteps')
+            profiler.count('ant_steps', n)
+            profiler.count('deliveries', len(delivered))
+        if self.recorder is not None:
+            self.recorder.record(timestep, self)
+
+    def record_deliveries(self, slots):
+        """
+        Count the food delivered by the ants in the slots.
+        """
+        self.food_found += len(slots)
+
+    def reset_ants(self, slots):
+        """
+        Put ants back to their start state at the colony.
+        """
+        self.hasfood[slots] = False
+        self.position[slots] = self.colony_cell
+        self.path_length[slots] = 1
+        self.visited[slots] = 0
+        self.mark_visited(slots, self.position[slots])
+
+    def mark_visited(self, slots, cells):
+        """
+        Set the visited bit of one cell for each of the (distinct) ants.
+        """
+        self.visited[slots, cells >> 3] |= (1 << (cells & 7)).astype(np.uint8)
+
+    def is_visited(self, slots, cells):
+        """
+        Visited bits of the cells, ants are broadcast against cells.
+        """
+        return (self.visited[slots, cells >> 3] >> (cells & 7).astype(np.uint8)) & 1 == 1
+
+    def ordered_deposits(self, slots, cells, amounts):
+        """
+        Apply deposits as if the ants deposited one after another in index order,
+        capping at max_pheromone after every deposit like Ant.step.
+        Cells are indexes into the pheromone store, so replicates never share a cell.
+        Returns the deposits sorted by cell and ant as keys cell*n_slots + slot,
+        with the pheromone level of the cell right after each deposit.
+        """
+        if len(slots) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        order = np.lexsort((slots, cells))
+        cells = cells[order]
+        keys = cells*len(self.position) + slots[order]
+        amounts = amounts[order]
+
+        # Rank of every deposit among the deposits on the same cell
+        index = np.arange(len(cells))
+        group_start = np.r_[True, cells[1:] != cells[:-1]]
+        rank = index - np.maximum.accumulate(np.where(group_start, index, 0))
+
+        levels = np.empty(len(cells))
+        for r in range(rank.max() + 1):
+            selected = np.flatnonzero(rank == r)
+            if r == 0:
+                previous = self.pheromone_values[cells[selected]]
+            else:
+                previous = levels[selected - 1]
+            levels[selected] = np.minimum(previous + amounts[selected], amw.max_pheromone)
+        return keys, levels
+
+    def random_numbers(self, slots):
+        """
+        One uniform random number in [0, 1) for each of the ants, in slot order.
+        With random streams every replicate draws from its own stream in ant order,
+        the same numbers the per-ant engine draws for the replicate.
+        """
+        if self.rngs is None:
+            return np.random.random(len(slots))
+        if len(self.lanes) == 1:
+            return self.rngs[self.lanes[0]].random_array(len(slots))
+        numbers = np.empty(len(slots))
+        lane_of_slot = slots % len(self.lanes)
+        for lane, replicate in enumerate(self.lanes.tolist()):
+            selected = np.flatnonzero(lane_of_slot == lane)
+            numbers[selected] = self.rngs[replicate].random_array(len(selected))
+        return numbers
+
+    def choose_cells_based_on_pheromones(self, slots, deposit_keys, deposit_levels):
+        """
+        Choose one of the adjacent cells for each ant based on pheromone level.
+        Returns the ants that found an unvisited neighbor and the directions they chose.
+        """
+        neighbors = self.neighbor_table[self.position[slots]]
+        # Remove cells that are walls or visited
+        valid = (neighbors >= 0) & ~self.is_visited(slots[:, None], neighbors)
+
+        cells = self.replicate_of(slots)[:, None]*self.n_cells + neighbors
+        pheromones = self.pheromone_values[cells]
+        if len(deposit_keys):
+            # An ant sees the deposits made earlier in the same timestep by ants with a lower index
+            n_slots = len(self.position)
+            last = np.searchsorted(deposit_keys, cells*n_slots + slots[:, None]) - 1
+            seen = (last >= 0) & (deposit_keys[last]//n_slots == cells)
+            pheromones = np.where(seen, deposit_levels[last], pheromones)
+
+        chances = np.where(valid, pheromones + amw.base_chance, 0)
+        cumulative_chance = np.cumsum(chances, axis=1)
+        total_chance = cumulative_chance[:, -1]
+        n_valid = np.count_nonzero(valid, axis=1)
+
+        can_move = n_valid > 0
+        slots = slots[can_move]
+        valid = valid[can_move]
+        cumulative_chance = cumulative_chance[can_move]
+        total_chance = total_chance[can_move]
+        n_valid = n_valid[can_move]
+        random_numbers = self.random_numbers(slots)
+
+        # Without pheromones every open neighbor is equally likely
+        no_pheromones = total_chance == n_valid*amw.base_chance
+        uniform_pick = (random_numbers*n_valid).astype(np.int64)
+        uniform_choice = np.cumsum(valid, axis=1) > uniform_pick[:, None]
+        # Otherwise pick the cell based on a random number between 0 and the total chance
+        pheromone_pick = random_numbers*total_chance
+        weighted_choice = valid & (cumulative_chance >= pheromone_pick[:, None])
+        choice = np.where(no_pheromones[:, None], uniform_choice, weighted_choice)
+
+        chosen = choice.any(axis=1)
+        column = np.argmax(choice, axis=1)
+        return slots[chosen], column[chosen]
+
+    def retire(self, replicates):
+        """
+        Stop simulating replicates, their ants are removed and their pheromones frozen.
+        """
+        keep = ~np.isin(self.lanes, replicates)
+        for replicate in self.lanes[~keep].tolist():
+            self.pheromone_store.freeze(replicate)
+
+        def compact(array):
+            by_ant = array.reshape((self.nAnts, len(self.lanes)) + array.shape[1:])
+            return np.ascontiguousarray(by_ant[:, keep]).reshape((-1,) + array.shape[1:])
+
+        self.position = compact(self.position)
+        self.hasfood = compact(self.hasfood)
+        self.path_length = compact(self.path_length)
+        self.final_path_length = compact(self.final_path_length)
+        self.moves = compact(self.moves)
+        self.visited = compact(self.visited)
+        self.lanes = self.lanes[keep]
@@ -0,0 +1,357 @@
+import argparse
+import hashlib
+import importlib
+import json
+import multiprocessing as mp
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+from profiling import format_summary
+from results_io import background_writer
+from rng_streams import new_root_seed
+from sweep_scheduler import _execute, estimate_cost
+
+# Folders of a queue: jobs waiting for a worker, jobs a worker holds a lease on,
+# committed results and jobs that failed max_attempts times
+queue_folders = ('pending', 'leased', 'results', 'failed')
+
+# Seconds after the last heartbeat of a worker before its job is given to another worker,
+# keep it well above the clock differences between the hosts sharing the queue
+lease_timeout = 60.0
+
+# Attempts of a job before it is moved to failed, a lost lease counts as an attempt
+max_attempts = 3
+
+# Seconds between looks at the queue of idle workers and the coordinator
+poll_interval = 0.5
+
+
+def target_name(target):
+    """
+    Importable name 'module:function' of a run function, workers on other hosts import it by name.
+    """
+    module = target.__module__
+    if module == '__main__':
+        module = os.path.splitext(os.path.basename(sys.modules['__main__'].__file__))[0]
+    return f'{module}:{target.__qualname__}'
+
+
+def load_target(name):
+    module, function = name.split(':')
+    return getattr(importlib.import_module(module), function)
+
+
+def job_id(target, spec):
+    """
+    Identifier of a job, a hash of its run function and specification. Publishing the same run
+    again gives the same job, so its committed result is reused. The specification holds the
+    root seed, so a sweep only gets its results back with the same root seed (see queue_root_seed).
+    """
+    key = json.dumps([target, spec], sort_keys=True, default=str)
+    return hashlib.sha1(key.encode()).hexdigest()[:24]
+
+
+def write_json(path, value):
+    """
+    Write a JSON file under a temporary name first, readers on other hosts never see half a file.
+    """
+    temporary_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w') as file:
+        json.dump(value, file, default=_plain)
+    os.replace(temporary_path, path)
+
+
+def read_json(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def queue_root_seed(folder):
+    """
+    Root seed of the sweeps of a queue folder without a root seed of their own. The first sweep
+    stores a new one in the folder and later sweeps reuse it, so publishing a sweep again reuses
+    its committed results.
+    """
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, 'root_seed.json')
+    if not os.path.exists(path):
+        temporary_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(new_root_seed(), file)
+        try:
+            # Sweeps that start at the same time all get the seed of the first link
+            os.link(temporary_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary_path)
+    return read_json(path)
+
+
+def _plain(value):
+    # numpy numbers and arrays in results
+    return value.tolist() if hasattr(value, 'tolist') else str(value)
+
+
+class WorkQueue:
+    def __init__(self, folder):
+        """
+        Queue of sweep runs in a folder that every host of the sweep can reach, such as an NFS share.
+        A job is a file that moves between the queue folders with atomic renames: a worker takes
+        a job by renaming it from pending to a lease of its own in leased and keeps the lease
+        alive by touching it. Leases that are not touched for lease_timeout seconds go back to
+        pending, so the jobs of lost workers run again. Results are committed with a hard link,
+        which fails if the result exists, so a job that ran twice keeps its first result.
+        """
+        self.folder = folder
+        for name in queue_folders:
+            os.makedirs(os.path.join(folder, name), exist_ok=True)
+
+    def path(self, name, filename):
+        return os.path.join(self.folder, name, filename)
+
+    def result_path(self, identifier):
+        return self.path('results', f'{identifier}.json')
+
+    def publish(self, target, specs):
+        """
+        Add a job for every specification that has no job or result yet. Job files start with
+        the inverted cost of the run, so workers take the most expensive runs first.
+        Returns the job identifiers in the order of specs.
+        """
+        name = target_name(target)
+        queued = {filename.split('~')[0] for filename in os.listdir(os.path.join(self.folder, 'leased'))}
+        queued.update(os.listdir(os.path.join(self.folder, 'pending')))
+        identifiers = []
+        for spec in specs:
+            identifier = job_id(name, spec)
+            identifiers.append(identifier)
+            filename = f'{max(10**15 - estimate_cost(spec), 0):015d}-{identifier}.json'
+            if filename in queued or os.path.exists(self.result_path(identifier)):
+                continue
+            if os.path.exists(self.path('failed', filename)):
+                # Publishing a failed run again gives it new attempts
+                os.remove(self.path('failed', filename))
+            write_json(self.path('pending', filename), {'id': identifier, 'target': name, 'spec': spec, 'attempts': 0,
+                                                        'errors': []})
+        return identifiers
+
+    def claim(self, worker):
+        """
+        Take the first pending job, returns its lease path and job or None when nothing is pending.
+        """
+        for filename in sorted(os.listdir(os.path.join(self.folder, 'pending'))):
+            if filename.endswith('.tmp'):
+                continue
+            pending = self.path('pending', filename)
+            lease = self.path('leased', f'{filename}~{worker}')
+            try:
+                # Touched first, a lease that kept the time it was published at would look expired
+                os.utime(pending)
+                # Only one worker can rename the file away from pending
+                os.rename(pending, lease)
+                return lease, read_json(lease)
+            except FileNotFoundError:
+                # Another worker took the job, or a reaper on another host took the lease back
+                continue
+        return None
+
+    def release(self, lease, error=None):
+        """
+        Give up a lease, after a failed attempt with its error. The job goes back to pending, or
+        to failed after max_attempts. Returns False if the lease was already taken back.
+        """
+        filename = os.path.basename(lease).split('~')[0]
+        released = f'{lease}~released'
+        try:
+            # Only one of the worker and the lease reapers gets the lease
+            os.rename(lease, released)
+            # The released lease gets a full timeout of its own, with the time of the expired
+            # lease other reapers would take it back at once
+            os.utime(released)
+            job = read_json(released)
+            job['attempts'] += 1
+            if error is not None:
+                job['errors'].append(error)
+            write_json(self.path('failed' if job['attempts'] >= max_attempts else 'pending', filename), job)
+            os.remove(released)
+        except FileNotFoundError:
+            # Another reaper took it back after all
+            return False
+        return True
+
+    def reap_expired(self):
+        """
+        Put the jobs of leases that were not touched for lease_timeout seconds back in the queue.
+        """
+        now = time.time()
+        for filename in os.listdir(os.path.join(self.folder, 'leased')):
+            lease = self.path('leased', filename)
+            try:
+                expired = now - os.path.getmtime(lease) > lease_timeout
+            except FileNotFoundError:
+                continue
+            if not expired:
+                continue
+            if filename.endswith('~released'):
+                # The releasing process died, the lease expires again in the next pass
+                try:
+                    os.rename(lease, lease[:-len('~released')])
+                except FileNotFoundError:
+                    pass
+            else:
+                self.release(lease, f'lease of {filename.split("~")[1]} expired')
+
+    def commit(self, lease, job, result):
+        """
+        Store the result of a job unless another worker already did, and end the lease.
+        """
+        temporary_path = self.path('results', f"{job['id']}.{os.path.basename(lease).split('~')[1]}.tmp")
+        with open(temporary_path, 'w') as file:
+            json.dump(result, file, default=_plain)
+        try:
+            os.link(temporary_path, self.result_path(job['id']))
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary_path)
+        self.end(lease)
+
+    def end(self, lease):
+        """
+        End a lease without giving the job back, for jobs that are done.
+        """
+        try:
+            os.remove(lease)
+        except FileNotFoundError:
+            pass
+
+    def failed_jobs(self):
+        return [read_json(self.path('failed', filename)) for filename in os.listdir(os.path.join(self.folder, 'failed'))
+                if not filename.endswith('.tmp')]
+
+    def pending_count(self):
+        return sum(1 for filename in os.listdir(os.path.join(self.folder, 'pending')) if not filename.endswith('.tmp'))
+
+
+def heartbeat(lease, stop):
+    """
+    Touch a lease until stop is set or the lease is gone.
+    """
+    while not stop.wait(lease_timeout/4):
+        try:
+            os.utime(lease)
+        except FileNotFoundError:
+            return
+
+
+def work(folder, idle_timeout=None, stop=None, worker=None):
+    """
+    Run jobs of the queue in folder until no job was pending for idle_timeout seconds (forever by
+    default) or the event stop is set. Result files of the runs are written relative to the
+    working directory, so workers on other hosts must start in the same shared folder.
+    Returns the number of jobs run.
+    """
+    queue = WorkQueue(folder)
+    worker = worker or f'{socket.gethostname()}-{os.getpid()}'
+    done = 0
+    idle_since = time.time()
+    while stop is None or not stop.is_set():
+        queue.reap_expired()
+        claimed = queue.claim(worker)
+        if claimed is None:
+            if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                break
+            time.sleep(poll_interval)
+            continue
+        lease, job = claimed
+        if os.path.exists(queue.result_path(job['id'])):
+            queue.end(lease)
+            continue
+
+        beating = threading.Event()
+        thread = threading.Thread(target=heartbeat, args=(lease, beating), daemon=True)
+        thread.start()
+        try:
+            _, result = _execute((load_target(job['target']), 0, job['spec']))
+            # The result files must be on disk before the job counts as done
+            background_writer().close()
+        except Exception:
+            beating.set()
+            queue.release(lease, f'{worker}: {traceback.format_exc()}')
+        else:
+            beating.set()
+            queue.commit(lease, job, result)
+            done += 1
+        thread.join()
+        idle_since = time.time()
+    return done
+
+
+def run_queued_sweep(target, specs, folder, processes=None, on_result=None, progress=True):
+    """
+    Run target(spec) for every specification through the work queue in folder, like
+    sweep_scheduler.run_sweep but with workers on any host that runs work_queue.py on the folder.
+    processes workers are started on this host as well, all cores by default and none with 0,
+    like the pool of sweep_scheduler.run_sweep. Results already committed to the queue
+    are reused. Returns the results in the order of specs, on_result(spec, result) is called
+    in this process as results come in. Raises RuntimeError if a job failed max_attempts times.
+    """
+    queue = WorkQueue(folder)
+    identifiers = queue.publish(target, specs)
+    print(f"Queued {queue.pending_count()} runs in {folder}, start workers with: python work_queue.py {folder}")
+
+    if processes is None:
+        processes = os.cpu_count()
+    stop = mp.Event()
+    workers = [mp.Process(target=work, args=(folder,), kwargs={'stop': stop}) for _ in range(processes)]
+    for process in workers:
+        process.start()
+    results = [None]*len(specs)
+    waiting = set(range(len(specs)))
+    start_time = time.time()
+    try:
+        while waiting:
+            queue.reap_expired()
+            for index in sorted(waiting):
+                path = queue.result_path(identifiers[index])
+                if not os.path.exists(path):
+                    continue
+                waiting.discard(index)
+                results[index] = read_json(path)
+                if progress:
+                    print(f"[{len(specs) - len(waiting)}/{len(specs)}] {specs[index]['name']} finished in"
+                          f" {results[index]['wall_time']:.2f} s --- {time.time() - start_time:.1f} seconds ---")
+                    if 'profile' in results[index]:
+                        print(f"    {format_summary(results[index]['profile'])}")
+                if on_result is not None:
+                    on_result(specs[index], results[index])
+            waiting_ids = {identifiers[index] for index in waiting}
+            failed = [job for job in queue.failed_jobs() if job['id'] in waiting_ids]
+            if failed:
+                raise RuntimeError(f"{len(failed)} runs failed {max_attempts} times, the last error of"
+                                   f" {failed[0]['spec']['name']}:\n{failed[0]['errors'][-1]}")
+            if waiting:
+                time.sleep(poll_interval)
+    finally:
+        stop.set()
+        for process in workers:
+            process.join()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run sweep jobs from a shared work queue folder')
+    parser.add_argument('folder', help='queue folder given to the sweep')
+    parser.add_argument('--processes', type=int, default=1, help='workers to start on this host')
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help='stop after this many seconds without pending jobs, by default workers keep waiting')
+    args = parser.parse_args()
+    if args.processes == 1:
+        print(f"{work(args.folder, args.idle_timeout)} runs done")
+    else:
+        with mp.Pool(args.processes) as pool:
+            print(f"{sum(pool.starmap(work, [(args.folder, args.idle_timeout)]*args.processes))} runs done")